@@ -4,7 +4,7 @@
 
 {
     "name": "Document Page",
-    "version": "16.0.1.4.0",
+    "version": "16.0.1.7.0",
     "category": "Knowledge Management",
     "author": "OpenERP SA, Odoo Community Association (OCA)",
     "images": [
@@ -21,12 +21,14 @@
     "data": [
         "security/document_page_security.xml",
         "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "wizard/document_page_create_menu.xml",
         "wizard/document_page_show_diff.xml",
         "views/document_page.xml",
         "views/document_page_category.xml",
         "views/document_page_history.xml",
         "views/report_document_page.xml",
+        "views/res_config_settings.xml",
     ],
     "demo": ["demo/document_page.xml"],
     "assets": {
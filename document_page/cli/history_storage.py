@@ -0,0 +1,43 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import optparse
+
+import odoo
+from odoo.cli import Command
+
+
+class DocumentPageHistoryStorage(Command):
+    """Convert document pages history to the configured storage mode"""
+
+    name = "document_page_history_storage"
+
+    def run(self, cmdargs):
+        parser = odoo.tools.config.parser
+        group = optparse.OptionGroup(parser, "Document Page History Storage")
+        group.add_option(
+            "--storage",
+            dest="storage",
+            type="choice",
+            choices=["full", "delta"],
+            help="Storage mode to switch to before converting, "
+            "defaults to the configured one.",
+        )
+        group.add_option(
+            "--batch-size",
+            dest="batch_size",
+            type="int",
+            default=50,
+            help="Number of pages converted and committed at once.",
+        )
+        parser.add_option_group(group)
+        opt = odoo.tools.config.parse_config(cmdargs)
+        registry = odoo.registry(odoo.tools.config["db_name"])
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            if opt.storage:
+                env["ir.config_parameter"].set_param(
+                    "document_page.history_storage", opt.storage
+                )
+            env["document.page.history"]._convert_history_storage(
+                batch_size=opt.batch_size, commit=True
+            )
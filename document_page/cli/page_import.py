@@ -0,0 +1,49 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import optparse
+import sys
+
+import odoo
+from odoo.cli import Command
+
+
+class DocumentPageImport(Command):
+    """Import a directory or a zip file of HTML and Markdown pages"""
+
+    name = "document_page_import"
+
+    def run(self, cmdargs):
+        parser = odoo.tools.config.parser
+        group = optparse.OptionGroup(parser, "Document Page Import")
+        group.add_option(
+            "--path",
+            dest="path",
+            help="Directory or zip file to import, folders become categories.",
+        )
+        group.add_option(
+            "--parent-id",
+            dest="parent_id",
+            type="int",
+            help="Id of the category the imported pages are added to.",
+        )
+        group.add_option(
+            "--batch-size",
+            dest="batch_size",
+            type="int",
+            default=1000,
+            help="Number of pages created and committed at once.",
+        )
+        parser.add_option_group(group)
+        opt = odoo.tools.config.parse_config(cmdargs)
+        if not opt.path:
+            sys.exit("--path is required")
+        registry = odoo.registry(odoo.tools.config["db_name"])
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            pages = env["document.page"]
+            pages._import_path(
+                opt.path,
+                parent=pages.browse(opt.parent_id) if opt.parent_id else None,
+                batch_size=opt.batch_size,
+                commit=True,
+            )
@@ -0,0 +1,36 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, http
+from odoo.http import content_disposition, request
+
+from ..tools import stream_zip
+
+
+class DocumentPageController(http.Controller):
+    @http.route("/document_page/export/<int:page_id>", type="http", auth="user")
+    def export_static_site(self, page_id):
+        """Stream a zip archive of the static copy of a page tree."""
+        page = request.env["document.page"].browse(page_id).exists()
+        if not page:
+            return request.not_found()
+        page.check_access_rights("read")
+        page.check_access_rule("read")
+        filename = f"{page.name}.zip"
+        registry = request.env.registry
+        uid, context = request.env.uid, dict(request.env.context)
+
+        def generate():
+            # the cursor of the request is closed once the response is
+            # returned, the archive is read and written with its own one
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                pages = env["document.page"].browse(page_id)
+                yield from stream_zip(pages._get_static_site_files())
+
+        return request.make_response(
+            generate(),
+            headers=[
+                ("Content-Type", "application/zip"),
+                ("Content-Disposition", content_disposition(filename)),
+            ],
+        )
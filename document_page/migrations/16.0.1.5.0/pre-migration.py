@@ -0,0 +1,11 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tools.sql import column_exists, rename_column
+
+
+def migrate(cr, version):
+    # Revisions content is now computed from its storage columns
+    if column_exists(cr, "document_page_history", "content") and not column_exists(
+        cr, "document_page_history", "content_raw"
+    ):
+        rename_column(cr, "document_page_history", "content", "content_raw")
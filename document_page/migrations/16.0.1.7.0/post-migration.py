@@ -0,0 +1,9 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    # Existing revisions are normalized in the background
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env.ref("document_page.ir_cron_normalize_history_content")._trigger()
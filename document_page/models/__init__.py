@@ -3,3 +3,5 @@
 from . import document_page
 from . import document_page_history
 from . import ir_ui_menu
+from . import res_company
+from . import res_config_settings
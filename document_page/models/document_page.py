@@ -1,8 +1,23 @@
 # Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import _, api, fields, models
-from odoo.exceptions import ValidationError
+import logging
+import time
+
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import html2plaintext, html_escape, split_every
+
+from ..tools import (
+    compute_digest,
+    normalize_html,
+    page_filename,
+    read_page_tree,
+    render_page,
+    rewrite_links,
+)
+
+_logger = logging.getLogger(__name__)
 
 
 class DocumentPage(models.Model):
@@ -12,6 +27,7 @@ class DocumentPage(models.Model):
     _inherit = ["mail.thread", "mail.activity.mixin"]
     _description = "Document Page"
     _order = "name"
+    _parent_store = True
 
     _HTML_WIDGET_DEFAULT_VALUE = "<p><br></p>"
 
@@ -26,12 +42,32 @@ class DocumentPage(models.Model):
         "document.page", "Category", domain=[("type", "=", "category")]
     )
     child_ids = fields.One2many("document.page", "parent_id", "Children")
+    parent_path = fields.Char(index=True, unaccent=False)
     content = fields.Html(
         compute="_compute_content",
         inverse="_inverse_content",
         search="_search_content",
         sanitize=False,
     )
+    content_digest = fields.Char(
+        help="Digest of the current content",
+        related="history_head.content_digest",
+        store=True,
+        readonly=True,
+    )
+    content_text = fields.Text(
+        "Plain Text Content",
+        help="Current content without markup, used to search pages",
+        compute="_compute_content_text",
+        store=True,
+        index="trigram",
+    )
+    content_match = fields.Char(
+        "Full Text",
+        help="Search pages through the full-text index of their content",
+        compute="_compute_content_match",
+        search="_search_content_match",
+    )
 
     draft_name = fields.Char(
         string="Name",
@@ -93,45 +129,196 @@ class DocumentPage(models.Model):
         help="Use it to link resources univocally",
         compute="_compute_backend_url",
     )
+    history_keep_days = fields.Integer(
+        "Keep All Revisions (Days)",
+        help="Older revisions of the pages of this category are compacted, "
+        "0 uses the policy of the parent category or keeps all revisions.",
+    )
+    history_keep_period = fields.Selection(
+        [("day", "One per Day"), ("week", "One per Week")],
+        "Then Keep",
+        help="Revisions kept once they are older than the retention delay",
+        default="week",
+    )
+    page_index = fields.Html(
+        "Index",
+        help="Rendered index of the children of this page",
+        compute="_compute_page_index",
+        store=True,
+        recursive=True,
+        sanitize=False,
+    )
 
     @api.depends("menu_id", "parent_id.menu_id")
     def _compute_backend_url(self):
         tmpl = "/web#id={}&model=document.page&view_type=form"
         for rec in self:
             url = tmpl.format(rec.id)
-            # retrieve action
-            action = None
-            parent = rec
-            while not action and parent:
-                action = parent.menu_id.action
-                parent = parent.parent_id
-            if action:
-                url += f"&action={action.id}"
+            # retrieve action, siblings share the one of their category
+            action_id = rec.menu_id.action.id or self._get_category_action_id(
+                rec.parent_id.id
+            )
+            if action_id:
+                url += f"&action={action_id}"
             rec.backend_url = url
 
+    @api.model
+    @tools.ormcache("category_id")
+    def _get_category_action_id(self, category_id):
+        """Return the action of the menu nearest to the given category.
+
+        The result is cached per category. Menu changes already clear the
+        caches, moving a category or replacing its menu does it in write().
+        """
+        if not category_id:
+            return False
+        category = self.sudo().browse(category_id).exists()
+        if not category:
+            return False
+        path_ids = category._get_parent_path_ids()[category.id] + category.ids
+        for parent in reversed(category.browse(path_ids)):
+            if parent.menu_id.action:
+                return parent.menu_id.action.id
+        return False
+
     @api.constrains("parent_id")
     def _check_parent_id(self):
-        if not self._check_recursion():
-            raise ValidationError(_("You cannot create recursive categories."))
+        # the materialized path of a page moved below itself holds its id twice
+        self.flush_model(["parent_id"])
+        self.invalidate_recordset(["parent_path"])
+        for rec in self:
+            if str(rec.id) in (rec.parent_path or "").split("/")[:-2]:
+                raise ValidationError(_("You cannot create recursive categories."))
+
+    def _get_descendants(self):
+        """Return all the pages below these ones, in one indexed query."""
+        return self.search([("id", "child_of", self.ids), ("id", "not in", self.ids)])
+
+    def _get_ancestors(self):
+        """Return all the categories above these pages, in one indexed query."""
+        return self.search([("id", "parent_of", self.ids), ("id", "not in", self.ids)])
+
+    def _get_subtree_count(self):
+        """Return the number of descendants of each page as a dict.
+
+        Each page gets one query on its materialized path, whose literal
+        prefix lets the index of the paths serve it.
+        """
+        self.flush_model(["parent_path"])
+        readable_query, readable_params = self._search([]).subselect()
+        counts = {}
+        for rec in self:
+            if not rec.parent_path:
+                counts[rec.id] = 0
+                continue
+            # pylint: disable=sql-injection
+            self.env.cr.execute(
+                f"""
+                SELECT COUNT(*) FROM document_page
+                WHERE parent_path LIKE %s AND id != %s AND id IN ({readable_query})
+                """,
+                [f"{rec.parent_path}%", rec.id, *readable_params],
+            )
+            counts[rec.id] = self.env.cr.fetchone()[0]
+        return counts
+
+    def _get_parent_path_ids(self):
+        """Return the ids of the ancestors of each page, root first.
+
+        They are read from the materialized path, so the tree is not walked
+        one level at a time. Records not saved yet fall back on ``parent_id``.
+        """
+        self.flush_model(["parent_id"])
+        res = {}
+        for rec in self:
+            if isinstance(rec.id, models.NewId) or not rec.parent_path:
+                parents = self.browse()
+                parent = rec.parent_id
+                while parent:
+                    parents = parent + parents
+                    parent = parent.parent_id
+                res[rec.id] = parents.ids
+            else:
+                res[rec.id] = [int(pid) for pid in rec.parent_path.split("/")[:-2]]
+        return res
+
+    def _get_history_retention(self):
+        """Return the retention policy of each page as a dict.
+
+        A policy is a ``(days, period)`` pair taken from the nearest category
+        defining one, pages without policy are left out.
+        """
+        path_ids = self._get_parent_path_ids()
+        prefetch_ids = {pid for ids in path_ids.values() for pid in ids}
+        res = {}
+        for page in self:
+            parents = self.browse(path_ids[page.id]).with_prefetch(prefetch_ids)
+            for category in reversed(parents):
+                if category.history_keep_days > 0:
+                    res[page.id] = (
+                        category.history_keep_days,
+                        category.history_keep_period or "week",
+                    )
+                    break
+        return res
+
+    @api.depends(
+        "child_ids.name",
+        "child_ids.active",
+        "child_ids.backend_url",
+        "child_ids.page_index",
+    )
+    def _compute_page_index(self):
+        """Render the index of the children from their own stored index.
+
+        Only the ancestors of a modified page get recomputed, each one
+        reusing the already rendered index of its children.
+        """
+        for rec in self:
+            index = [
+                "<li>" + subpage._get_page_index() + "</li>"
+                for subpage in rec.child_ids
+            ]
+            rec.page_index = "<ul>" + "".join(index) + "</ul>" if index else False
 
     def _get_page_index(self, link=True):
         """Return the index of a document."""
         self.ensure_one()
-        index = [
-            "<li>" + subpage._get_page_index() + "</li>" for subpage in self.child_ids
-        ]
         r = ""
         if link:
             r = f'<a href="{self.backend_url}">{self.name}</a>'
-        if index:
-            r += "<ul>" + "".join(index) + "</ul>"
+        if self.page_index:
+            r += str(self.page_index)
         return r
 
-    @api.depends("history_head")
+    def _get_readable_page_index(self):
+        """Return the index of the children the current user can read.
+
+        The stored index is rendered with superuser rights, it is only
+        served as is when no page below is hidden from the user.
+        """
+        self.ensure_one()
+        readable = self._get_descendants()
+        if len(readable) == len(self.sudo()._get_descendants()):
+            return self.page_index
+        return self._render_page_index(set(readable.ids))
+
+    def _render_page_index(self, readable_ids):
+        """Render the index of the children among the readable pages."""
+        index = [
+            f'<li><a href="{child.backend_url}">{child.name}</a>'
+            f"{child._render_page_index(readable_ids) or ''}</li>"
+            for child in self.child_ids
+            if child.id in readable_ids
+        ]
+        return "<ul>" + "".join(index) + "</ul>" if index else False
+
+    @api.depends("history_head", "page_index")
+    @api.depends_context("uid")
     def _compute_content(self):
         for rec in self:
             if rec.type == "category":
-                rec.content = rec._get_page_index(link=False)
+                rec.content = rec._get_readable_page_index() or ""
             else:
                 if rec.history_head:
                     rec.content = rec.history_head.content
@@ -141,7 +328,10 @@ class DocumentPage(models.Model):
 
     def _inverse_content(self):
         for rec in self:
-            if rec.type == "content" and rec.content != rec.history_head.content:
+            if (
+                rec.type == "content"
+                and compute_digest(normalize_html(rec.content)) != rec.content_digest
+            ):
                 rec._create_history(
                     {
                         "page_id": rec.id,
@@ -155,8 +345,287 @@ class DocumentPage(models.Model):
         self.ensure_one()
         return self.env["document.page.history"].create(vals)
 
+    @api.model
+    def _prepare_import_history_vals(self, page, content):
+        """Values of the first revision of an imported page.
+
+        The content is stored directly, a first revision is always stored in
+        full, so revisions are inserted in batch without going through the
+        inverse of their content.
+        """
+        content = normalize_html(content)
+        return {
+            "page_id": page.id,
+            "name": "1.0",
+            "summary": _("Imported"),
+            "content_raw": content,
+            "content_digest": compute_digest(content),
+            "content_normalized": True,
+        }
+
+    @api.model
+    def _import_tree(self, nodes, parent=None, batch_size=1000, commit=False):
+        """Create the pages and categories of a tree, in batches.
+
+        ``nodes`` is a list of dicts with a ``name`` and either ``children``,
+        a list of nodes making it a category, or a ``content``, HTML given as
+        is or through a callable. Each level of the tree is created with
+        batched creates of pages then of their first revision, chatter
+        tracking is disabled and computed fields are computed once per batch.
+        Return statistics about the import.
+        """
+        start = time.time()
+        stats = {"categories": 0, "pages": 0}
+        pages = self.with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_create_nosubscribe=True,
+            mail_notrack=True,
+        )
+        history = pages.env["document.page.history"]
+        level = [(node, parent.id if parent else False) for node in nodes]
+        while level:
+            next_level = []
+            for batch in split_every(batch_size, level):
+                records = pages.create(
+                    [
+                        {
+                            "name": node["name"],
+                            "type": "category" if "children" in node else "content",
+                            "parent_id": parent_id,
+                        }
+                        for node, parent_id in batch
+                    ]
+                )
+                history_vals = []
+                for (node, __), record in zip(batch, records, strict=True):
+                    if "children" in node:
+                        stats["categories"] += 1
+                        next_level += [(child, record.id) for child in node["children"]]
+                        continue
+                    stats["pages"] += 1
+                    content = node.get("content")
+                    if callable(content):
+                        content = content()
+                    if content:
+                        history_vals.append(
+                            self._prepare_import_history_vals(record, content)
+                        )
+                history.create(history_vals)
+                pages.env.flush_all()
+                if commit:
+                    self.env.cr.commit()  # pylint: disable=invalid-commit
+                pages.env.invalidate_all()
+                _logger.info(
+                    "Imported %(categories)s categories and %(pages)s pages", stats
+                )
+            level = next_level
+        stats["seconds"] = time.time() - start
+        stats["pages_per_second"] = stats["pages"] / (stats["seconds"] or 1)
+        _logger.info(
+            "Imported %(pages)s pages in %(seconds).1fs (%(pages_per_second).1f/s)",
+            stats,
+        )
+        return stats
+
+    @api.model
+    def _import_path(self, path, parent=None, batch_size=1000, commit=False):
+        """Import the HTML and Markdown files of a directory or a zip file.
+
+        Folders become categories and files become pages.
+        """
+        return self._import_tree(
+            read_page_tree(path), parent=parent, batch_size=batch_size, commit=commit
+        )
+
+    def action_export_static_site(self):
+        """Download a static copy of the category and of its pages."""
+        self.ensure_one()
+        return {
+            "type": "ir.actions.act_url",
+            "url": f"/document_page/export/{self.id}",
+            "target": "self",
+        }
+
+    def _get_static_site_files(self, batch_size=100):
+        """Yield the ``(filename, html)`` files of a static copy of the pages.
+
+        These pages and all their descendants get one file each, with their
+        links to each other rewritten to the exported files, and an
+        ``index.html`` lists them. Pages are read in batches with the cache
+        emptied in between, so memory does not grow with the tree.
+        """
+        page_ids = self.search([("id", "child_of", self.ids)], order="id").ids
+        exported = set(page_ids)
+        index = "".join(
+            f'<li><a href="{page_filename(root.id)}">{html_escape(root.name)}</a>'
+            f"{rewrite_links(str(root._get_readable_page_index() or ''), exported)}"
+            "</li>"
+            for root in self
+        )
+        yield "index.html", render_page(_("Index"), f"<ul>{index}</ul>")
+        history = self.env["document.page.history"]
+        for batch_ids in split_every(batch_size, page_ids):
+            for page in self.browse(batch_ids):
+                nav = f'<a href="index.html">{html_escape(_("Index"))}</a>'
+                parent = page.parent_id
+                if parent.id in exported:
+                    nav += (
+                        f' / <a href="{page_filename(parent.id)}">'
+                        f"{html_escape(parent.name)}</a>"
+                    )
+                content = rewrite_links(str(page.content or ""), exported)
+                yield page_filename(page.id), render_page(page.name, content, nav)
+            self.invalidate_model()
+            history.invalidate_model()
+
     def _search_content(self, operator, value):
-        return [("history_head.content", operator, value)]
+        return [("content_text", operator, value)]
+
+    @api.depends("history_head.content")
+    def _compute_content_text(self):
+        for rec in self:
+            if rec.type == "content" and rec.history_head.content:
+                rec.content_text = html2plaintext(rec.history_head.content)
+            else:
+                rec.content_text = False
+
+    def _compute_content_match(self):
+        self.content_match = False
+
+    def _search_content_match(self, operator, value):
+        if operator not in ("ilike", "=", "like", "not ilike", "!=", "not like"):
+            raise UserError(_("Unsupported operator for full-text search."))
+        self.flush_model(["content_text", "company_id"])
+        match, params, __, __ = self._get_search_condition("document_page", value)
+        query = f"SELECT id FROM document_page WHERE {match}"
+        if operator in ("not ilike", "!=", "not like"):
+            return [("id", "not inselect", (query, params))]
+        return [("id", "inselect", (query, params))]
+
+    @api.model
+    def _get_search_configs(self):
+        """Return the companies whose pages are indexed with each text search
+        configuration, as a dict. ``None`` stands for pages without company."""
+        self.env["res.company"].flush_model(["document_page_search_config"])
+        self.env.cr.execute(
+            """
+            SELECT COALESCE(document_page_search_config, 'simple'), array_agg(id)
+            FROM res_company
+            GROUP BY 1
+            """
+        )
+        configs = dict(self.env.cr.fetchall())
+        configs.setdefault("simple", []).append(None)
+        return configs
+
+    @api.model
+    def _get_search_condition(self, alias, text):
+        """Return the SQL matching ``text`` against the pages of ``alias``.
+
+        Each page is matched with a query parsed by the configuration of its
+        company, the one its content was indexed with. Each configuration
+        gets its own condition, so that the full-text index is still used.
+        Return the condition and its params, then the expression of the
+        query of each page and its params.
+        """
+        conditions, condition_params = [], []
+        queries, query_params = [], []
+        for config, company_ids in self._get_search_configs().items():
+            company = f"{alias}.company_id = ANY(%s)"
+            if None in company_ids:
+                company = f"({company} OR {alias}.company_id IS NULL)"
+            ids = [company_id for company_id in company_ids if company_id]
+            tsquery = "websearch_to_tsquery(%s::regconfig, %s)"
+            conditions.append(f"({company} AND {alias}.content_tsv @@ {tsquery})")
+            condition_params += [ids, config, text or ""]
+            queries.append(f"WHEN {company} THEN {tsquery}")
+            query_params += [ids, config, text or ""]
+        return (
+            "(" + " OR ".join(conditions) + ")",
+            condition_params,
+            "CASE " + " ".join(queries) + " END",
+            query_params,
+        )
+
+    @api.model
+    def search_ranked(self, text, domain=None, limit=80):
+        """Return the pages matching ``text``, the most relevant first.
+
+        ``text`` accepts the web search syntax of PostgreSQL (quoted
+        phrases, ``or`` and ``-`` to exclude words). Access rules and
+        ``domain`` are applied as in a regular search.
+        """
+        ranked = self._search_ranked(text, domain=domain, limit=limit)
+        return self.browse([page_id for page_id, __ in ranked])
+
+    @api.model
+    def _search_ranked(self, text, domain=None, limit=80):
+        """Return ``(page id, rank)`` pairs for ``text``, best match first."""
+        self.flush_model(["content_text", "company_id"])
+        query = self._search(list(domain or []))
+        from_clause, where_clause, where_params = query.get_sql()
+        match, match_params, tsquery, tsquery_params = self._get_search_condition(
+            '"document_page"', text
+        )
+        # pylint: disable=sql-injection
+        self.env.cr.execute(
+            f"""
+            SELECT "document_page".id,
+                ts_rank("document_page".content_tsv, {tsquery}) AS rank
+            FROM {from_clause}
+            WHERE {where_clause or "TRUE"} AND {match}
+            ORDER BY rank DESC, "document_page".id
+            LIMIT %s
+            """,
+            tsquery_params + where_params + match_params + [limit],
+        )
+        return self.env.cr.fetchall()
+
+    def init(self):
+        # The tsvector is kept outside of the ORM, it is refreshed in _write
+        # each time the plain text or the company of a page changes.
+        self.env.cr.execute(
+            "ALTER TABLE document_page ADD COLUMN IF NOT EXISTS content_tsv tsvector"
+        )
+        tools.create_index(
+            self.env.cr,
+            "document_page_content_tsv_index",
+            self._table,
+            ["content_tsv"],
+            method="gin",
+        )
+
+    def _update_content_tsv(self):
+        """Refresh the full-text index with the language of each company."""
+        if not self.ids:
+            return
+        self.env["res.company"].flush_model(["document_page_search_config"])
+        self.env.cr.execute(
+            """
+            UPDATE document_page page
+            SET content_tsv = to_tsvector(
+                COALESCE(company.document_page_search_config, 'simple')::regconfig,
+                COALESCE(page.content_text, '')
+            )
+            FROM document_page page2
+            LEFT JOIN res_company company ON company.id = page2.company_id
+            WHERE page2.id = page.id AND page.id IN %s
+            """,
+            [tuple(self.ids)],
+        )
+
+    @api.model
+    def _create(self, data_list):
+        records = super()._create(data_list)
+        records._update_content_tsv()
+        return records
+
+    def _write(self, vals):
+        res = super()._write(vals)
+        if "content_text" in vals or "company_id" in vals:
+            self._update_content_tsv()
+        return res
 
     @api.depends("history_ids")
     def _compute_history_head(self):
@@ -175,8 +644,28 @@ class DocumentPage(models.Model):
         ):
             self.content = self.parent_id.template
 
+    def write(self, vals):
+        res = super().write(vals)
+        if "menu_id" in vals or (
+            "parent_id" in vals and "category" in self.mapped("type")
+        ):
+            self.clear_caches()
+            # the links of the whole subtree point to another action, the
+            # stored indexes holding them are rendered again
+            self.invalidate_model(["backend_url"])
+            pages = self.sudo().with_context(active_test=False)
+            self.env.add_to_compute(
+                self._fields["page_index"],
+                pages | pages._get_descendants() | pages._get_ancestors(),
+            )
+        return res
+
     def unlink(self):
         menus = self.mapped("menu_id")
+        # children are detached through the ORM, so that their materialized
+        # path does not keep the ids of the deleted pages
+        children = self.sudo().with_context(active_test=False).child_ids - self
+        children.write({"parent_id": False})
         res = super().unlink()
         menus.unlink()
         return res
@@ -1,9 +1,61 @@
 # Copyright (C) 2004-2010 Tiny SPRL (<http://tiny.be>).
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-import difflib
+import base64
+import bisect
+import logging
+import re
+from collections import defaultdict
+from datetime import timedelta
 
 from odoo import _, api, fields, models
+from odoo.tools import split_every
+
+from ..tools import (
+    SizedLRUCache,
+    apply_delta,
+    compute_digest,
+    make_delta,
+    make_diff_table,
+    normalize_html,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Rendered diffs, shared by the requests served by this worker
+diff_cache = SizedLRUCache(32 * 1024 * 1024)
+
+
+# Operators of the searches on contents also applied to the ones stored as deltas
+CONTENT_SEARCH_OPERATORS = (
+    "=",
+    "!=",
+    "like",
+    "ilike",
+    "not like",
+    "not ilike",
+    "=like",
+    "=ilike",
+)
+
+
+def _make_content_matcher(operator, value):
+    """Return a function telling whether a content matches a condition of a
+    domain, for the contents which cannot be searched in the database."""
+    negate = operator in ("!=", "not like", "not ilike")
+    if operator in ("=", "!="):
+        return lambda content: (content == str(value or "")) != negate
+    pattern = str(value or "")
+    if not operator.startswith("="):
+        pattern = f"%{pattern}%"
+    regex = re.compile(
+        "".join(
+            ".*" if char == "%" else "." if char == "_" else re.escape(char)
+            for char in pattern
+        ),
+        re.DOTALL | (re.IGNORECASE if "ilike" in operator else 0),
+    )
+    return lambda content: bool(regex.fullmatch(content)) != negate
 
 
 class DocumentPageHistory(models.Model):
@@ -16,7 +68,43 @@ class DocumentPageHistory(models.Model):
     page_id = fields.Many2one("document.page", "Page", ondelete="cascade")
     name = fields.Char(index=True)
     summary = fields.Char(index=True)
-    content = fields.Html(sanitize=False)
+    content = fields.Html(
+        compute="_compute_content",
+        inverse="_inverse_content",
+        search="_search_content",
+        sanitize=False,
+    )
+    content_raw = fields.Html(
+        "Stored Content",
+        help="Full content of the revision, empty when stored as a delta",
+        sanitize=False,
+        readonly=True,
+    )
+    content_delta = fields.Binary(
+        "Stored Delta",
+        help="Compressed changes from the keyframe revision",
+        attachment=False,
+        readonly=True,
+    )
+    keyframe_id = fields.Many2one(
+        "document.page.history",
+        "Keyframe",
+        help="Revision holding the full content this delta applies to",
+        index=True,
+        ondelete="cascade",
+        readonly=True,
+    )
+    content_digest = fields.Char(
+        help="Digest of the content, identical contents share the same digest",
+        index=True,
+        readonly=True,
+        copy=False,
+    )
+    content_normalized = fields.Boolean(
+        help="The content has been stored with one block element per line",
+        readonly=True,
+        copy=False,
+    )
     diff = fields.Html(compute="_compute_diff")
 
     company_id = fields.Many2one(
@@ -29,42 +117,356 @@ class DocumentPageHistory(models.Model):
         readonly=True,
     )
 
+    @api.depends("content_raw", "content_delta", "keyframe_id.content_raw")
+    def _compute_content(self):
+        # keyframes may be revisions the user cannot read, like others drafts
+        for rec in self:
+            if rec.keyframe_id:
+                rec.content = apply_delta(
+                    rec.keyframe_id.sudo().content_raw or "",
+                    base64.b64decode(rec.content_delta),
+                )
+            else:
+                rec.content = rec.content_raw
+
+    def _inverse_content(self):
+        for rec in self:
+            rec._store_content(rec.content)
+
+    def _search_content(self, operator, value):
+        """Search the stored contents in the database, and the contents of
+        the revisions stored as deltas once rebuilt, in batches."""
+        if operator not in CONTENT_SEARCH_OPERATORS:
+            # other operators only apply to the contents stored in full
+            return [("content_raw", operator, value)]
+        match = _make_content_matcher(operator, value)
+        revisions = self.sudo()
+        delta_ids = []
+        for ids in split_every(
+            1000, revisions.search([("keyframe_id", "!=", False)]).ids
+        ):
+            batch = revisions.browse(ids)
+            delta_ids += [rec.id for rec in batch if match(str(rec.content or ""))]
+            batch.invalidate_recordset(["content", "content_delta"])
+        return [
+            "|",
+            "&",
+            ("keyframe_id", "=", False),
+            ("content_raw", operator, value),
+            ("id", "in", delta_ids),
+        ]
+
+    def _store_content(self, content):
+        """Store the content in full or as a delta, following the settings."""
+        self.ensure_one()
+        if not self.keyframe_id and (self.content_raw or self.content_delta):
+            # revisions relying on this one must not follow its changes
+            self.sudo().search([("keyframe_id", "=", self.id)])._store_full_content()
+        content = normalize_html(str(content or ""))
+        vals = self._prepare_content_storage(content)
+        vals.update(content_digest=compute_digest(content), content_normalized=True)
+        self.write(vals)
+
+    def _store_full_content(self):
+        for rec in self:
+            rec.write(
+                {
+                    "content_raw": rec.content,
+                    "content_delta": False,
+                    "keyframe_id": False,
+                }
+            )
+
+    def _prepare_content_storage(self, content):
+        full = {"content_raw": content, "content_delta": False, "keyframe_id": False}
+        params = self.env["ir.config_parameter"].sudo()
+        if params.get_param("document_page.history_storage") != "delta":
+            return full
+        keyframe = self._get_delta_keyframe()
+        if not keyframe:
+            return full
+        delta = make_delta(str(keyframe.content_raw or ""), content)
+        if len(delta) * 2 > len(content.encode()):
+            return full
+        return {
+            "content_raw": False,
+            "content_delta": base64.b64encode(delta),
+            "keyframe_id": keyframe.id,
+        }
+
+    def _get_delta_keyframe(self):
+        """Return the keyframe a new delta of this revision can apply to.
+
+        Every revision is reconstructed from its keyframe and a single delta,
+        a new keyframe is started once the last one has enough dependents.
+        """
+        self.ensure_one()
+        history = self.sudo()
+        keyframe = history.search(
+            [
+                ("page_id", "=", self.page_id.id),
+                ("keyframe_id", "=", False),
+                ("id", "<", self.id),
+            ],
+            order="id DESC",
+            limit=1,
+        )
+        interval = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("document_page.history_keyframe_interval", 20)
+        )
+        if keyframe and history.search_count([("keyframe_id", "=", keyframe.id)]) < (
+            interval - 1
+        ):
+            return keyframe
+        return history.browse()
+
+    @api.model
+    def _convert_history_storage(self, batch_size=50, commit=False):
+        """Rewrite existing revisions with the current storage settings.
+
+        Pages are processed by increasing id in batches. The last page done is
+        remembered, so an interrupted conversion resumes where it stopped.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        pages = self.env["document.page"].sudo().with_context(active_test=False)
+        last_id = int(params.get_param("document_page.history_storage_page_id", 0))
+        while True:
+            batch = pages.search([("id", ">", last_id)], order="id", limit=batch_size)
+            if not batch:
+                break
+            self.sudo().search(
+                [("page_id", "in", batch.ids)], order="page_id, id"
+            )._rewrite_content_storage()
+            last_id = batch[-1].id
+            params.set_param("document_page.history_storage_page_id", last_id)
+            _logger.info("Converted history storage up to page %s", last_id)
+            if commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            self.env.invalidate_all()
+        params.set_param("document_page.history_storage_page_id", 0)
+
+    def _rewrite_content_storage(self):
+        """Store these revisions again, oldest first, with the current settings."""
+        contents = {rec.id: normalize_html(str(rec.content or "")) for rec in self}
+        for rec in self:
+            rec.write(
+                {
+                    "content_raw": contents[rec.id],
+                    "content_delta": False,
+                    "keyframe_id": False,
+                    "content_digest": compute_digest(contents[rec.id]),
+                    "content_normalized": True,
+                }
+            )
+        for rec in self.sorted("id"):
+            rec.write(rec._prepare_content_storage(contents[rec.id]))
+
+    @api.model
+    def _backfill_content_digest(self, batch_size=1000):
+        """Compute the digest of existing revisions, in batches."""
+        history = self.sudo()
+        last_id = 0
+        while True:
+            batch = history.search([("id", ">", last_id)], order="id", limit=batch_size)
+            if not batch:
+                break
+            for rec in batch:
+                rec.content_digest = compute_digest(rec.content)
+            batch.flush_recordset()
+            last_id = batch[-1].id
+            self.env.invalidate_all()
+
+    @api.model
+    def _cron_normalize_content(self, batch_size=100):
+        """Normalize the content of revisions stored before it was done on save.
+
+        All the revisions of a page are rewritten together, so deltas keep
+        applying to their keyframe. The cron is triggered again until none
+        are left.
+        """
+        history = self.sudo()
+        pending = history.search([("content_normalized", "=", False)], limit=batch_size)
+        if not pending:
+            return
+        history.search(
+            ["|", ("page_id", "in", pending.page_id.ids), ("id", "in", pending.ids)],
+            order="page_id, id",
+        )._rewrite_content_storage()
+        self.env.ref("document_page.ir_cron_normalize_history_content")._trigger()
+
+    @api.model
+    def _compact_history(self, batch_size=100, commit=False):
+        """Remove the old revisions dropped by the retention policies.
+
+        Pages are processed in batches, each one in its own transaction when
+        ``commit`` is set. Return the number of revisions removed and the
+        size of the stored content reclaimed, in bytes.
+        """
+        pages = self.env["document.page"].sudo().with_context(active_test=False)
+        categories = pages.search(
+            [("type", "=", "category"), ("history_keep_days", ">", 0)]
+        )
+        stats = {"revisions": 0, "bytes": 0}
+        if not categories:
+            return stats
+        page_ids = pages.search(
+            [("id", "child_of", categories.ids), ("type", "=", "content")],
+            order="id",
+        ).ids
+        for batch_ids in split_every(batch_size, page_ids):
+            batch = pages.browse(batch_ids)
+            revisions = self.sudo()._get_compactable_revisions(batch)
+            if revisions:
+                size = self._get_storage_size(batch)
+                count = len(revisions)
+                revisions.unlink()
+                reclaimed = size - self._get_storage_size(batch)
+                stats["revisions"] += count
+                stats["bytes"] += reclaimed
+                _logger.info(
+                    "Compacted %s revisions of pages %s to %s, %s bytes reclaimed",
+                    count,
+                    batch_ids[0],
+                    batch_ids[-1],
+                    reclaimed,
+                )
+            if commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            self.env.invalidate_all()
+        _logger.info(
+            "Compacted %(revisions)s revisions, %(bytes)s bytes reclaimed", stats
+        )
+        return stats
+
+    @api.model
+    def _get_compactable_revisions(self, pages):
+        """Return the revisions of ``pages`` their retention policy drops.
+
+        Past the retention delay, only the last revision of each day or week
+        is kept, besides the revisions protected from compaction.
+        """
+        policies = pages._get_history_retention()
+        revisions = self.search(
+            [("page_id", "in", list(policies))], order="create_date DESC, id DESC"
+        )
+        protected = revisions._get_compaction_protected()
+        now = fields.Datetime.now()
+        periods = set()
+        res = []
+        for rev in revisions:
+            days, period = policies[rev.page_id.id]
+            if rev.create_date >= now - timedelta(days=days):
+                continue
+            if period == "day":
+                key = (rev.page_id.id, rev.create_date.date())
+            else:
+                key = (rev.page_id.id,) + tuple(rev.create_date.isocalendar()[:2])
+            if key in periods and rev not in protected:
+                res.append(rev.id)
+            periods.add(key)
+        return self.browse(res)
+
+    def _get_compaction_protected(self):
+        """Return the revisions kept whatever their age, the current ones."""
+        return self.filtered(lambda rev: rev == rev.page_id.history_head)
+
+    @api.model
+    def _get_storage_size(self, pages):
+        """Return the size of the stored content of the revisions of ``pages``."""
+        self.flush_model(["page_id", "content_raw", "content_delta"])
+        self.env.cr.execute(
+            """
+            SELECT COALESCE(SUM(
+                COALESCE(pg_column_size(content_raw), 0)
+                + COALESCE(pg_column_size(content_delta), 0)
+            ), 0)
+            FROM document_page_history
+            WHERE page_id IN %s
+            """,
+            [tuple(pages.ids)],
+        )
+        return self.env.cr.fetchone()[0]
+
+    def unlink(self):
+        dependents = self.sudo().search(
+            [("keyframe_id", "in", self.ids), ("id", "not in", self.ids)]
+        )
+        dependents._store_full_content()
+        return super().unlink()
+
     def _compute_diff(self):
         """Shows a diff between this version and the previous version"""
-        history = self.env["document.page.history"]
+        predecessors = self._get_predecessors()
         for rec in self:
-            prev = history.search(
-                [
-                    ("page_id", "=", rec.page_id.id),
-                    ("create_date", "<", rec.create_date),
-                ],
-                limit=1,
-                order="create_date DESC",
-            )
-            rec.diff = self._get_diff(prev.id, rec.id)
+            rec.diff = self._get_diff(predecessors[rec.id].id, rec.id)
+
+    def _get_predecessor_domain(self):
+        """Domain of the revisions that can precede these ones."""
+        return [("page_id", "in", self.page_id.ids)]
+
+    def _get_predecessor_key(self):
+        """Position of a revision in the history of its page.
+
+        A revision is preceded by the candidate with the greatest key lower
+        than its own one, or by the last candidate when its key is None.
+        """
+        self.ensure_one()
+        return (self.create_date, self.id) if self.create_date else None
+
+    def _get_predecessors(self):
+        """Return the previous revision of each revision as a dict.
+
+        The candidates of all the pages are fetched with a single query.
+        """
+        candidates = defaultdict(list)
+        for candidate in self.search(self._get_predecessor_domain()):
+            key = candidate._get_predecessor_key()
+            if key is not None:
+                candidates[candidate.page_id.id].append((key, candidate))
+        keys = {}
+        for page_id, page_candidates in candidates.items():
+            page_candidates.sort(key=lambda item: item[0])
+            keys[page_id] = [item[0] for item in page_candidates]
+        res = {}
+        for rec in self:
+            page_candidates = candidates[rec.page_id.id]
+            key = rec._get_predecessor_key()
+            if key is None:
+                index = len(page_candidates)
+            else:
+                index = bisect.bisect_left(keys.get(rec.page_id.id, []), key)
+            res[rec.id] = page_candidates[index - 1][1] if index else self.browse()
+        return res
 
     @api.model
     def _get_diff(self, v1, v2):
-        """Return the difference between two version of document version."""
-        text1 = v1 and self.browse(v1).content or ""
-        text2 = v2 and self.browse(v2).content or ""
-        # Include line breaks to make it more readable
-        # TODO: consider using a beautify library directly on the content
-        text1 = text1.replace("</p><p>", "</p>\r\n<p>")
-        text2 = text2.replace("</p><p>", "</p>\r\n<p>")
+        """Return the difference between two version of document version.
+
+        Rendered diffs are cached until the content of a revision changes.
+        """
+        digest1 = v1 and self.browse(v1).content_digest
+        digest2 = v2 and self.browse(v2).content_digest
+        if v1 == v2 or (digest1 and digest1 == digest2):
+            return _("There are no changes in revisions.")
+        key = (self.env.cr.dbname, self.env.lang, v1, v2, digest1, digest2)
+        diff = diff_cache.get(key)
+        if diff is None:
+            diff = self._render_diff(v1, v2)
+            diff_cache.set(key, diff)
+        return diff
+
+    @api.model
+    def _render_diff(self, v1, v2):
+        text1 = str(v1 and self.browse(v1).content or "")
+        text2 = str(v2 and self.browse(v2).content or "")
+        # Content is stored with one block per line, see normalize_html()
         line1 = text1.splitlines(True)
         line2 = text2.splitlines(True)
         if line1 == line2:
             return _("There are no changes in revisions.")
-        else:
-            diff = difflib.HtmlDiff()
-            return diff.make_table(
-                line1,
-                line2,
-                f"Revision-{v1}",
-                f"Revision-{v2}",
-                context=True,
-            )
+        return make_diff_table(line1, line2, f"Revision-{v1}", f"Revision-{v2}")
 
     def name_get(self):
         return [(rec.id, "%s #%i" % (rec.page_id.name, rec.id)) for rec in self]
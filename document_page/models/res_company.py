@@ -0,0 +1,32 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+
+    document_page_search_config = fields.Selection(
+        "_get_document_page_search_configs",
+        string="Document Pages Search Language",
+        help="Language used to index and search the content of document pages",
+        default="simple",
+    )
+
+    @api.model
+    def _get_document_page_search_configs(self):
+        self.env.cr.execute("SELECT cfgname FROM pg_ts_config ORDER BY cfgname")
+        return [(name, name.capitalize()) for (name,) in self.env.cr.fetchall()]
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "document_page_search_config" in vals:
+            pages = (
+                self.env["document.page"]
+                .with_context(active_test=False)
+                .search([("company_id", "in", self.ids)])
+            )
+            for batch in split_every(1000, pages.ids, pages.browse):
+                batch._update_content_tsv()
+        return res
@@ -0,0 +1,27 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = "res.config.settings"
+
+    document_page_search_config = fields.Selection(
+        related="company_id.document_page_search_config",
+        readonly=False,
+    )
+    document_page_history_storage = fields.Selection(
+        [("full", "Full content"), ("delta", "Keyframes and deltas")],
+        string="Page History Storage",
+        help="Store each revision in full, or only the changes from a periodic "
+        "full revision. Existing revisions are converted with the "
+        "document_page_history_storage command.",
+        config_parameter="document_page.history_storage",
+        default="full",
+    )
+    document_page_history_keyframe_interval = fields.Integer(
+        string="Revisions per Keyframe",
+        help="Number of revisions after which a full revision is stored again",
+        config_parameter="document_page.history_keyframe_interval",
+        default=20,
+    )
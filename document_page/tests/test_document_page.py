@@ -1,6 +1,14 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import io
+import os
+import tempfile
+import zipfile
+
+from odoo.exceptions import ValidationError
 from odoo.tests import common
 
+from ..tools import stream_zip
+
 
 class TestDocumentPage(common.TransactionCase):
     def setUp(self):
@@ -23,6 +31,88 @@ class TestDocumentPage(common.TransactionCase):
         page.content = "<p>New content for Demo Page</p>"
         self.assertEqual(len(page.history_ids), 2)
 
+    def test_page_content_digest(self):
+        page = self.page_obj.create(
+            {"name": "Digest Page", "content": "<p>Digest content</p>"}
+        )
+        self.assertTrue(page.content_digest)
+        self.assertEqual(page.content_digest, page.history_head.content_digest)
+        page.write({"content": "<p>Digest content</p>"})
+        self.assertEqual(len(page.history_ids), 1)
+        page.write({"content": "<p>Other content</p>"})
+        self.assertEqual(len(page.history_ids), 2)
+        self.assertEqual(page.content_digest, page.history_ids[0].content_digest)
+
+    def test_page_import_tree(self):
+        stats = self.page_obj._import_tree(
+            [
+                {
+                    "name": "Imported Category",
+                    "children": [
+                        {"name": "Imported Page", "content": "<p>One</p><p>Two</p>"},
+                        {"name": "Lazy Page", "content": lambda: "<p>Lazy</p>"},
+                    ],
+                },
+                {"name": "Empty Page"},
+            ],
+            parent=self.category1,
+            batch_size=1,
+        )
+        self.assertEqual(stats["categories"], 1)
+        self.assertEqual(stats["pages"], 3)
+        category = self.page_obj.search([("name", "=", "Imported Category")])
+        self.assertEqual(category.type, "category")
+        self.assertEqual(category.parent_id, self.category1)
+        page = category.child_ids.filtered(lambda p: p.name == "Imported Page")
+        self.assertEqual(page.content, "<p>One</p>\n<p>Two</p>")
+        self.assertEqual(page.content_digest, page.history_head.content_digest)
+        self.assertIn("Lazy Page", category.content)
+
+    def test_page_import_path(self):
+        with tempfile.TemporaryDirectory() as path:
+            os.mkdir(os.path.join(path, "Folder"))
+            with open(os.path.join(path, "Folder", "Page.html"), "w") as file:
+                file.write("<p>From a file</p>")
+            with open(os.path.join(path, "ignored.txt"), "w") as file:
+                file.write("Not a page")
+            stats = self.page_obj._import_path(path)
+        self.assertEqual(stats["pages"], 1)
+        page = self.page_obj.search([("name", "=", "Page")])
+        self.assertEqual(page.parent_id.name, "Folder")
+        self.assertEqual(page.content, "<p>From a file</p>")
+
+    def test_page_export_static_site(self):
+        category = self.page_obj.create({"name": "Export", "type": "category"})
+        page = self.page_obj.create(
+            {"name": "Exported", "parent_id": category.id, "content": "<p>Exported</p>"}
+        )
+        other = self.page_obj.create(
+            {
+                "name": "Linking",
+                "parent_id": category.id,
+                "content": f'<p><a href="{page.backend_url}">link</a></p>',
+            }
+        )
+        files = dict(category._get_static_site_files(batch_size=1))
+        self.assertEqual(
+            set(files),
+            {
+                "index.html",
+                f"page-{category.id}.html",
+                f"page-{page.id}.html",
+                f"page-{other.id}.html",
+            },
+        )
+        self.assertIn("<p>Exported</p>", files[f"page-{page.id}.html"])
+        self.assertIn(f'href="page-{page.id}.html"', files[f"page-{other.id}.html"])
+        self.assertIn(f'href="page-{other.id}.html"', files["index.html"])
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(files.items()))))
+        self.assertEqual(
+            archive.read(f"page-{page.id}.html").decode(), files[f"page-{page.id}.html"]
+        )
+        action = category.action_export_static_site()
+        self.assertEqual(action["url"], f"/document_page/export/{category.id}")
+
     def test_category_template(self):
         page = self.page_obj.create(
             {"name": "Test Page 2", "parent_id": self.category1.id}
@@ -35,6 +125,112 @@ class TestDocumentPage(common.TransactionCase):
         page.content = "New content"
         self.assertIsNotNone(page.history_ids[0].diff)
 
+    def test_category_index(self):
+        category = self.page_obj.create({"name": "Index Category", "type": "category"})
+        subcategory = self.page_obj.create(
+            {"name": "Index Subcategory", "type": "category", "parent_id": category.id}
+        )
+        page = self.page_obj.create(
+            {"name": "Index Page", "parent_id": subcategory.id, "content": "Test"}
+        )
+        self.assertIn("Index Page", category.content)
+        self.assertIn(page.backend_url, subcategory.page_index)
+        page.name = "Renamed Index Page"
+        self.assertIn("Renamed Index Page", category.content)
+        page.active = False
+        self.assertNotIn("Index Page", category.content)
+        self.assertIn("Index Subcategory", category.content)
+        subcategory.unlink()
+        self.assertFalse(category.page_index)
+
+    def test_category_unlink(self):
+        category = self.page_obj.create({"name": "Root Category", "type": "category"})
+        subcategory = self.page_obj.create(
+            {"name": "Deleted Category", "type": "category", "parent_id": category.id}
+        )
+        page = self.page_obj.create(
+            {"name": "Orphan Page", "parent_id": subcategory.id, "content": "Test"}
+        )
+        category.menu_id = self.env["ir.ui.menu"].create({"name": "Root Category"})
+        category.unlink()
+        self.assertFalse(subcategory.parent_id)
+        self.assertEqual(subcategory._get_parent_path_ids()[subcategory.id], [])
+        self.assertEqual(page._get_parent_path_ids()[page.id], [subcategory.id])
+        self.assertIn(f"id={page.id}&", page.backend_url)
+
+    def test_category_index_menu(self):
+        category = self.page_obj.create({"name": "Menu Category", "type": "category"})
+        subcategory = self.page_obj.create(
+            {"name": "Menu Subcategory", "type": "category", "parent_id": category.id}
+        )
+        page = self.page_obj.create(
+            {"name": "Menu Page", "parent_id": subcategory.id, "content": "Test"}
+        )
+        action = self.env.ref("document_page.action_page")
+        menu = self.env["ir.ui.menu"].create(
+            {"name": "Menu Category", "action": f"{action._name},{action.id}"}
+        )
+        category.menu_id = menu
+        self.assertIn(f"&action={action.id}", page.backend_url)
+        self.assertIn(page.backend_url, subcategory.page_index)
+
+    def test_page_hierarchy(self):
+        category = self.page_obj.create({"name": "Tree Category", "type": "category"})
+        subcategory = self.page_obj.create(
+            {"name": "Tree Subcategory", "type": "category", "parent_id": category.id}
+        )
+        page = self.page_obj.create(
+            {"name": "Tree Page", "parent_id": subcategory.id, "content": "Test"}
+        )
+        self.assertEqual(category._get_descendants(), subcategory | page)
+        self.assertEqual(page._get_ancestors(), category | subcategory)
+        self.assertEqual(
+            (category | subcategory)._get_subtree_count(),
+            {category.id: 2, subcategory.id: 1},
+        )
+        self.assertEqual(
+            page._get_parent_path_ids(), {page.id: [category.id, subcategory.id]}
+        )
+        page.parent_id = category
+        self.assertEqual(page._get_ancestors(), category)
+        self.assertEqual(subcategory._get_subtree_count(), {subcategory.id: 0})
+        with self.assertRaises(ValidationError):
+            category.parent_id = subcategory
+
+    def test_page_search_content(self):
+        page = self.page_obj.create(
+            {"name": "Search Page", "content": "<p>Quick brown wikifox</p>"}
+        )
+        self.assertEqual(page.content_text, "Quick brown wikifox")
+        self.assertIn(page, self.page_obj.search([("content", "ilike", "wikifox")]))
+        self.assertNotIn(page, self.page_obj.search([("content", "ilike", "<p>")]))
+        self.assertEqual(
+            self.page_obj.search([("content_match", "ilike", "wikifox")]), page
+        )
+        self.assertEqual(self.page_obj.search_ranked("brown wikifox"), page)
+        page.content = "<p>Slow grey wikiwolf</p>"
+        self.assertFalse(self.page_obj.search_ranked("wikifox"))
+        self.assertNotIn(
+            page, self.page_obj.search([("content_match", "not ilike", "wikiwolf")])
+        )
+
+    def test_page_search_content_companies(self):
+        """Pages are matched with the search language of their company."""
+        company = self.env["res.company"].create(
+            {"name": "English Wiki", "document_page_search_config": "english"}
+        )
+        page = self.page_obj.create(
+            {
+                "name": "English Page",
+                "content": "<p>Running wikifoxes</p>",
+                "company_id": company.id,
+            }
+        )
+        self.assertEqual(
+            self.page_obj.search([("content_match", "ilike", "run wikifox")]), page
+        )
+        self.assertEqual(self.page_obj.search_ranked("wikifox"), page)
+
     def test_page_link(self):
         page = self.page_obj.create({"name": "Test Page 3", "content": "Test content"})
         self.assertEqual(
@@ -50,6 +246,27 @@ class TestDocumentPage(common.TransactionCase):
             ),
         )
 
+    def test_page_link_category(self):
+        category = self.page_obj.create({"name": "Link Category", "type": "category"})
+        subcategory = self.page_obj.create(
+            {"name": "Link Subcategory", "type": "category", "parent_id": category.id}
+        )
+        pages = self.page_obj.create(
+            [
+                {"name": "Link Page 1", "parent_id": subcategory.id},
+                {"name": "Link Page 2", "parent_id": subcategory.id},
+            ]
+        )
+        self.assertNotIn("&action=", pages[0].backend_url)
+        menu = self.env.ref("document_knowledge.menu_document")
+        category.menu_id = menu
+        pages.invalidate_recordset(["backend_url"])
+        for page in pages:
+            self.assertTrue(page.backend_url.endswith(f"&action={menu.action.id}"))
+        subcategory.parent_id = False
+        pages.invalidate_recordset(["backend_url"])
+        self.assertNotIn("&action=", pages[1].backend_url)
+
     def test_page_copy(self):
         page = self.page_obj.create({"name": "Test Page 3", "content": "Test content"})
         page_copy = page.copy()
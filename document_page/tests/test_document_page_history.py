@@ -1,5 +1,11 @@
+from datetime import timedelta
+
+from odoo import fields
 from odoo.tests import common
 
+from odoo.addons.document_page.models.document_page_history import diff_cache
+from odoo.addons.document_page.tools import execute_in_batches
+
 
 class TestDocumentPageHistory(common.TransactionCase):
     """document_page_history test class."""
@@ -17,3 +23,147 @@ class TestDocumentPageHistory(common.TransactionCase):
 
         result = history_document._get_diff(active_ids[0], active_ids[1])
         self.assertNotEqual(result, "There are no changes in revisions.")
+
+    def test_page_history_delta_storage(self):
+        """Revisions stored as deltas keep their content."""
+        self.env["ir.config_parameter"].set_param(
+            "document_page.history_storage", "delta"
+        )
+        lines = "".join(f"<p>Line {i}</p>\n" for i in range(50))
+        page = self.env["document.page"].create(
+            {"name": "Delta Page", "content": lines}
+        )
+        contents = [lines]
+        for i in range(3):
+            contents.append(lines + f"<p>Added {i}</p>\n")
+            page.content = contents[-1]
+        history = page.history_ids.sorted("id")
+        self.assertFalse(history[0].keyframe_id)
+        self.assertTrue(all(rec.keyframe_id == history[0] for rec in history[1:]))
+        self.assertFalse(history[1].content_raw)
+        history.invalidate_recordset()
+        self.assertEqual([str(rec.content) for rec in history], contents)
+        # contents stored as deltas are searched too
+        history_obj = self.env["document.page.history"]
+        self.assertEqual(
+            history_obj.search(
+                [("page_id", "=", page.id), ("content", "ilike", "added 1")]
+            ),
+            history[2],
+        )
+        self.assertEqual(
+            history_obj.search(
+                [("page_id", "=", page.id), ("content", "not ilike", "added")]
+            ),
+            history[0],
+        )
+        # removing the keyframe keeps the content of its dependents
+        history[0].unlink()
+        self.assertFalse(history[1].keyframe_id)
+        self.assertEqual(str(history[2].content), contents[2])
+        self.env["ir.config_parameter"].set_param(
+            "document_page.history_storage", "full"
+        )
+        self.env["document.page.history"]._convert_history_storage()
+        self.assertEqual(str(history[3].content_raw), contents[3])
+
+    def test_page_history_compact(self):
+        """Old revisions are compacted to one per day."""
+        category = self.env["document.page"].create(
+            {
+                "name": "Retention Category",
+                "type": "category",
+                "history_keep_days": 10,
+                "history_keep_period": "day",
+            }
+        )
+        subcategory = self.env["document.page"].create(
+            {
+                "name": "Retention Subcategory",
+                "type": "category",
+                "parent_id": category.id,
+            }
+        )
+        page = self.env["document.page"].create(
+            {
+                "name": "Retention Page",
+                "parent_id": subcategory.id,
+                "content": "<p>0</p>",
+            }
+        )
+        for i in range(1, 6):
+            page.content = f"<p>{i}</p>"
+        history = page.history_ids.sorted("id")
+        now = fields.Datetime.now()
+        # two revisions on each of two old days, two recent ones
+        dates = [now - timedelta(days=30)] * 2 + [now - timedelta(days=20)] * 2
+        dates += [now, now]
+        for rec, date in zip(history, dates, strict=True):
+            self.env.cr.execute(
+                "UPDATE document_page_history SET create_date = %s WHERE id = %s",
+                [date, rec.id],
+            )
+        history.invalidate_recordset()
+        self.assertEqual(page._get_history_retention(), {page.id: (10, "day")})
+        stats = self.env["document.page.history"]._compact_history()
+        self.assertEqual(stats["revisions"], 2)
+        self.assertEqual(history.exists(), history[1] | history[3:])
+        self.assertEqual(str(page.content), "<p>5</p>")
+
+    def test_page_history_diff_batch(self):
+        """Predecessors are resolved for the whole recordset."""
+        page = self.env["document.page"].create(
+            {"name": "Diff Page", "content": "<p>First</p>"}
+        )
+        page.content = "<p>First</p><p>Second</p>"
+        page.content = "<p>Third</p>"
+        history = page.history_ids.sorted("id")
+        predecessors = history._get_predecessors()
+        self.assertFalse(predecessors[history[0].id])
+        self.assertEqual(predecessors[history[1].id], history[0])
+        self.assertEqual(predecessors[history[2].id], history[1])
+        self.assertIn("diff_add", history[1].diff)
+        self.assertIn("Third", history[2].diff)
+        hits = diff_cache.hits
+        history.invalidate_recordset(["diff"])
+        self.assertIn("Third", history[2].diff)
+        self.assertGreater(diff_cache.hits, hits)
+
+    def test_page_history_normalized(self):
+        """Content is stored with one block per line and diffed by line."""
+        page = self.env["document.page"].create(
+            {"name": "Normalized Page", "content": "<p>One</p><p>Two</p>"}
+        )
+        history = page.history_head
+        self.assertEqual(history.content, "<p>One</p>\n<p>Two</p>")
+        self.assertTrue(history.content_normalized)
+        page.write({"content": "<p>One</p>  <p>Two</p>"})
+        self.assertEqual(page.history_head, history)
+        page.write({"content": "<p>One</p><p>Three</p>"})
+        diff = page.history_head.diff
+        self.assertIn("Three", diff)
+        self.assertIn("Two", diff)
+        history.write({"content_normalized": False, "content_raw": "<p>A</p><p>B</p>"})
+        self.env["document.page.history"]._cron_normalize_content()
+        self.assertEqual(history.content, "<p>A</p>\n<p>B</p>")
+        self.assertTrue(history.content_normalized)
+
+    def test_page_history_execute_in_batches(self):
+        """Statements run by ranges of ids over the matching rows only."""
+        page = self.env["document.page"].create(
+            {"name": "Batched Page", "content": "<p>One</p>"}
+        )
+        for content in ("<p>Two</p>", "<p>Three</p>"):
+            page.write({"content": content})
+        self.env.flush_all()
+        count = execute_in_batches(
+            self.env.cr,
+            "UPDATE document_page_history SET summary = 'batched' WHERE {where}",
+            "document_page_history",
+            where="page_id = %(page_id)s",
+            params={"page_id": page.id},
+            batch_size=1,
+        )
+        self.assertEqual(count, 3)
+        page.history_ids.invalidate_recordset(["summary"])
+        self.assertEqual(set(page.history_ids.mapped("summary")), {"batched"})
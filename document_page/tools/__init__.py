@@ -0,0 +1,10 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from .delta import apply_delta, make_delta
+from .diff import make_diff_table
+from .digest import compute_digest
+from .html import normalize_html
+from .lru import SizedLRUCache
+from .page_import import read_page_tree
+from .site_export import page_filename, render_page, rewrite_links, stream_zip
+from .sql import execute_in_batches
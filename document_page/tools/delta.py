@@ -0,0 +1,34 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Line based deltas used to store revisions of document pages.
+
+A delta is a zlib compressed JSON list of operations applied to the lines
+of a source text: a ``[start, end]`` pair copies a slice of the source
+lines and a string is inserted as is.
+"""
+
+import difflib
+import json
+import zlib
+
+
+def make_delta(source, target):
+    """Return the compressed delta turning ``source`` into ``target``."""
+    source_lines = source.splitlines(True)
+    target_lines = target.splitlines(True)
+    matcher = difflib.SequenceMatcher(None, source_lines, target_lines)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j1 != j2:
+            ops.append("".join(target_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops).encode())
+
+
+def apply_delta(source, delta):
+    """Return the text obtained by applying ``delta`` to ``source``."""
+    source_lines = source.splitlines(True)
+    return "".join(
+        "".join(source_lines[op[0] : op[1]]) if isinstance(op, list) else op
+        for op in json.loads(zlib.decompress(delta))
+    )
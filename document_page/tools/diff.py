@@ -0,0 +1,91 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""HTML side by side diff of two lists of lines.
+
+Lines are matched as a whole, only the pairs of changed lines are compared
+word by word, which keeps the cost close to linear for usual edits unlike
+``difflib.HtmlDiff`` that compares every changed line character by character.
+The markup mimics ``difflib.HtmlDiff.make_table`` so existing styles apply.
+"""
+
+import difflib
+import re
+from html import escape
+
+# Changed lines longer than this are highlighted as a whole
+MAX_WORD_DIFF_LENGTH = 2000
+
+_WORDS_RE = re.compile(r"(\s+)")
+
+
+def _format(text):
+    return escape(text.rstrip("\r\n")).replace("  ", "&nbsp; ")
+
+
+def _mark(text, css_class):
+    return f'<span class="{css_class}">{_format(text)}</span>' if text else ""
+
+
+def _diff_words(line1, line2):
+    if len(line1) + len(line2) > MAX_WORD_DIFF_LENGTH:
+        return _mark(line1, "diff_chg"), _mark(line2, "diff_chg")
+    words1 = _WORDS_RE.split(line1.rstrip("\r\n"))
+    words2 = _WORDS_RE.split(line2.rstrip("\r\n"))
+    left, right = [], []
+    matcher = difflib.SequenceMatcher(None, words1, words2, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        text1, text2 = "".join(words1[i1:i2]), "".join(words2[j1:j2])
+        if tag == "equal":
+            left.append(_format(text1))
+            right.append(_format(text2))
+        else:
+            left.append(_mark(text1, "diff_sub" if tag == "delete" else "diff_chg"))
+            right.append(_mark(text2, "diff_add" if tag == "insert" else "diff_chg"))
+    return "".join(left), "".join(right)
+
+
+def _row(num1, text1, num2, text2):
+    return (
+        f'<tr><td class="diff_header">{num1 or ""}</td><td nowrap="nowrap">{text1}</td>'
+        f'<td class="diff_header">{num2 or ""}</td><td nowrap="nowrap">{text2}</td></tr>'
+    )
+
+
+def _opcode_rows(lines1, lines2, tag, i1, i2, j1, j2):
+    rows = []
+    for k in range(max(i2 - i1, j2 - j1)):
+        i, j = i1 + k, j1 + k
+        line1 = lines1[i] if i < i2 else None
+        line2 = lines2[j] if j < j2 else None
+        if tag == "equal":
+            text1, text2 = _format(line1), _format(line2)
+        elif line1 is not None and line2 is not None:
+            text1, text2 = _diff_words(line1, line2)
+        else:
+            text1 = _mark(line1, "diff_sub") if line1 is not None else ""
+            text2 = _mark(line2, "diff_add") if line2 is not None else ""
+        rows.append(
+            _row(
+                line1 is not None and i + 1,
+                text1,
+                line2 is not None and j + 1,
+                text2,
+            )
+        )
+    return rows
+
+
+def make_diff_table(lines1, lines2, fromdesc, todesc, context=3):
+    """Return an HTML table of the changes between two lists of lines."""
+    matcher = difflib.SequenceMatcher(None, lines1, lines2)
+    rows = []
+    for group in matcher.get_grouped_opcodes(context):
+        if rows:
+            rows.append('<tr><td class="diff_next" colspan="4">...</td></tr>')
+        for opcode in group:
+            rows.extend(_opcode_rows(lines1, lines2, *opcode))
+    return (
+        '<table class="diff" summary="Legends">'
+        f'<thead><tr><th class="diff_header" colspan="2">{escape(fromdesc)}</th>'
+        f'<th class="diff_header" colspan="2">{escape(todesc)}</th></tr></thead>'
+        f"<tbody>{''.join(rows)}</tbody></table>"
+    )
@@ -0,0 +1,10 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import hashlib
+
+
+def compute_digest(content):
+    """Return the digest identifying a content, False for an empty one."""
+    if not content:
+        return False
+    return hashlib.sha256(str(content).encode()).hexdigest()
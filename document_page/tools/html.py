@@ -0,0 +1,40 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import re
+
+# Tags put on their own line, whitespace around them is not significant
+BLOCK_TAGS = (
+    "address|article|aside|blockquote|br|dd|div|dl|dt|figcaption|figure|footer|"
+    "h[1-6]|header|hr|li|nav|ol|p|pre|section|table|tbody|td|tfoot|th|thead|tr|ul"
+)
+
+_PRE_RE = re.compile(r"(<pre\b[^>]*>.*?</pre>)", re.IGNORECASE | re.DOTALL)
+_BLOCK_RE = re.compile(rf"\s*(</?(?:{BLOCK_TAGS})\b[^>]*>)\s*", re.IGNORECASE)
+_OPENING_RE = re.compile(rf"<(?:{BLOCK_TAGS})\b", re.IGNORECASE)
+
+
+def _break_block(match):
+    tag = match.group(1)
+    if _OPENING_RE.match(tag) and not tag.lower().startswith("<br"):
+        return "\n" + tag
+    return tag + "\n"
+
+
+def normalize_html(content):
+    """Return ``content`` with one block element per line.
+
+    Whitespace around block tags is replaced by a single line break, before
+    opening tags and after closing ones, and preformatted blocks are kept as
+    they are. The rendering is unchanged while the result does not depend on
+    how the editor laid out the markup, so it can be diffed line by line and
+    hashed.
+    """
+    if not content:
+        return content
+    parts = _PRE_RE.split(str(content))
+    for i in range(0, len(parts), 2):
+        parts[i] = _BLOCK_RE.sub(_break_block, parts[i].replace("\r\n", "\n"))
+    # each <pre> block also gets its own line
+    for i in range(1, len(parts), 2):
+        parts[i] = "\n" + parts[i] + "\n"
+    return re.sub(r"\n{2,}", "\n", "".join(parts)).strip("\n")
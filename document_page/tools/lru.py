@@ -0,0 +1,65 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import threading
+from collections import OrderedDict
+
+
+class SizedLRUCache:
+    """Least recently used cache bounded by the total size of its values.
+
+    It is shared by the threads of a worker, and keeps hit and miss counters
+    so its efficiency can be checked.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, __ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=None):
+        if size is None:
+            size = len(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            self.pop(key)
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                __, (__, old_size) = self._data.popitem(last=False)
+                self.size -= old_size
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+            return item and item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,79 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Read a tree of pages from a directory or a zip file.
+
+Folders become categories, HTML and Markdown files become pages. The
+content of each file is only read when its page is created.
+"""
+
+import logging
+import os
+import zipfile
+
+from odoo import _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
+    _logger.debug("markdown is not available, Markdown pages cannot be imported")
+
+HTML_EXTENSIONS = (".html", ".htm")
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+
+def to_html(data, extension):
+    """Return the HTML content of a file read as bytes."""
+    text = data.decode("utf-8")
+    if extension in MARKDOWN_EXTENSIONS:
+        if markdown is None:
+            raise UserError(_("Install the markdown library to import Markdown."))
+        return markdown.markdown(text)
+    return text
+
+
+def _add_file(tree, parts, loader):
+    """Add the file at ``parts`` to ``tree``, a nested dict of folders."""
+    extension = os.path.splitext(parts[-1])[1].lower()
+    if extension not in HTML_EXTENSIONS + MARKDOWN_EXTENSIONS:
+        return
+    for folder in parts[:-1]:
+        tree = tree.setdefault(folder, {})
+    tree[parts[-1]] = lambda: to_html(loader(), extension)
+
+
+def _to_nodes(tree):
+    nodes = []
+    for name in sorted(tree):
+        value = tree[name]
+        if isinstance(value, dict):
+            nodes.append({"name": name, "children": _to_nodes(value)})
+        else:
+            nodes.append({"name": os.path.splitext(name)[0], "content": value})
+    return nodes
+
+
+def read_page_tree(path):
+    """Return the pages stored at ``path`` as nodes for ``_import_tree``."""
+    tree = {}
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        for info in archive.infolist():
+            if not info.is_dir():
+                parts = [part for part in info.filename.split("/") if part]
+                _add_file(tree, parts, lambda name=info.filename: archive.read(name))
+        return _to_nodes(tree)
+    for root, __, files in os.walk(path):
+        folders = os.path.relpath(root, path).split(os.sep)
+        folders = [folder for folder in folders if folder != "."]
+        for filename in files:
+            filepath = os.path.join(root, filename)
+
+            def loader(filepath=filepath):
+                with open(filepath, "rb") as file:
+                    return file.read()
+
+            _add_file(tree, folders + [filename], loader)
+    return _to_nodes(tree)
@@ -0,0 +1,86 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Write a static copy of pages as a zip archive streamed in chunks."""
+
+import io
+import re
+import zipfile
+
+from odoo.tools import html_escape
+
+PAGE_LINK = re.compile(
+    r'href="[^"]*/web#id=(\d+)&(?:amp;)?model=document\.page(?:[&#][^"]*)?"'
+)
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8"/>
+<title>{title}</title>
+</head>
+<body>
+<nav>{nav}</nav>
+<h1>{title}</h1>
+<main>
+{content}
+</main>
+</body>
+</html>
+"""
+
+
+def page_filename(page_id):
+    return f"page-{page_id}.html"
+
+
+def rewrite_links(content, page_ids):
+    """Point the links to the pages in ``page_ids`` to their exported file."""
+
+    def replace(match):
+        page_id = int(match.group(1))
+        if page_id not in page_ids:
+            return match.group(0)
+        return f'href="{page_filename(page_id)}"'
+
+    return PAGE_LINK.sub(replace, content or "")
+
+
+def render_page(title, content, nav=""):
+    return PAGE_TEMPLATE.format(title=html_escape(title), nav=nav, content=content)
+
+
+class ZipStream(io.RawIOBase):
+    """Unseekable file the archive is written to, drained after each file."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """Yield the chunks of a zip archive of ``(filename, content)`` pairs.
+
+    Only the file being compressed is kept in memory, the archive is never
+    built as a whole.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for filename, content in files:
+            archive.writestr(filename, content)
+            data = stream.drain()
+            if data:
+                yield data
+    data = stream.drain()
+    if data:
+        yield data
@@ -0,0 +1,54 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def execute_in_batches(
+    cr, query, table, where="TRUE", params=None, batch_size=10000, commit=False
+):
+    """Execute ``query`` on the rows of ``table`` matching ``where``, by
+    ranges of ``batch_size`` ids.
+
+    ``query`` selects its rows with a ``{where}`` placeholder, which is
+    replaced by ``where`` restricted to the current range of ids. Only the
+    ranges holding matching rows are visited, and the statement is committed
+    after each range when ``commit`` is set, so that locks and WAL stay
+    bounded. A query which no longer matches the rows it processed, like an
+    update of their state or a deletion, can be run again after an
+    interruption and resumes where it stopped.
+
+    Return the number of rows affected.
+    """
+    # pylint: disable=sql-injection
+    cr.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE {where}", params)
+    start, last = cr.fetchone()
+    if start is None:
+        return 0
+    first = start
+    batch_query = query.format(
+        where=f"({where}) AND {table}.id >= %(start)s AND {table}.id < %(stop)s"
+    )
+    next_query = f"SELECT MIN(id) FROM {table} WHERE ({where}) AND id >= %(stop)s"
+    total = 0
+    while start is not None:
+        stop = start + batch_size
+        # pylint: disable=sql-injection
+        cr.execute(batch_query, dict(params or {}, start=start, stop=stop))
+        total += cr.rowcount
+        if commit:
+            cr.commit()  # pylint: disable=invalid-commit
+        _logger.info(
+            "%s: %d rows done, %d%% of ids %d-%d",
+            table,
+            total,
+            100 * (min(stop, last + 1) - first) // (last + 1 - first),
+            first,
+            last,
+        )
+        # skip the ranges without matching rows
+        # pylint: disable=sql-injection
+        cr.execute(next_query, dict(params or {}, stop=stop))
+        start = cr.fetchone()[0]
+    return total
@@ -27,3 +27,20 @@ class TestDocumentPageAccessGroup(common.TransactionCase):
         self.page.write({"groups_id": [(4, self.test_group)]})
         with self.assertRaises(UserError):
             self.page.with_user(self.user_id).check_access_rule("read")
+
+    def test_category_index_access(self):
+        category = self.env["document.page"].create(
+            {"name": "Category 1", "type": "category"}
+        )
+        self.page.parent_id = category
+        hidden = self.env["document.page"].create(
+            {
+                "name": "Hidden Page",
+                "parent_id": category.id,
+                "groups_id": [(4, self.test_group)],
+            }
+        )
+        self.assertIn(hidden.name, category.content)
+        content = category.with_user(self.user_id).content
+        self.assertIn(self.page.name, content)
+        self.assertNotIn(hidden.name, content)
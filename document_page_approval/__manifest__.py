@@ -3,7 +3,7 @@
 
 {
     "name": "Document Page Approval",
-    "version": "16.0.1.1.1",
+    "version": "16.0.1.2.0",
     "author": "Savoir-faire Linux, Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/knowledge",
     "license": "AGPL-3",
@@ -11,8 +11,10 @@
     "depends": ["document_page", "mail"],
     "data": [
         "data/email_template.xml",
-        "views/document_page_approval.xml",
+        "data/ir_cron.xml",
         "security/document_page_security.xml",
+        "views/document_page_approval.xml",
+        "views/document_page_approval_report.xml",
         "security/ir.model.access.csv",
     ],
     "images": [
@@ -0,0 +1,13 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import http
+from odoo.http import request
+
+
+class DocumentPageApprovalController(http.Controller):
+    @http.route("/document_page_approval/metrics", type="json", auth="user")
+    def approval_metrics(self, window_days=30):
+        """Return the approval queue metrics, for dashboards and monitoring."""
+        return request.env["document.page.approval.report"].get_approval_metrics(
+            window_days=int(window_days)
+        )
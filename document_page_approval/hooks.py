@@ -2,24 +2,54 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 import logging
 
+from odoo import SUPERUSER_ID, api
+from odoo.tools import split_every
+
+from odoo.addons.document_page.tools import execute_in_batches
+
 _logger = logging.getLogger(__name__)
 
 
 def post_init_hook(cr, registry):  # pragma: no cover
     # Set all pre-existing pages history to approved
     _logger.info("Setting history to approved.")
-    cr.execute(
+    execute_in_batches(
+        cr,
         """
         UPDATE document_page_history
         SET state='approved',
             approved_uid=create_uid,
             approved_date=create_date
-        WHERE state IS NULL OR state = 'draft'
-    """
+        WHERE {where}
+        """,
+        "document_page_history",
+        where="state IS NULL OR state = 'draft'",
+        commit=True,
     )
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env["document.page"].with_context(active_test=False).search(
+        [("parent_id", "=", False)]
+    )._update_approval_inheritance()
 
 
 def uninstall_hook(cr, registry):  # pragma: no cover
     # Remove unapproved pages
     _logger.info("Deleting unapproved Change Requests.")
-    cr.execute("DELETE FROM document_page_history WHERE state != 'approved'")
+    # Approved revisions stored as a delta of an unapproved one keep their content
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    history = env["document.page.history"]
+    revisions = history.search(
+        [("state", "=", "approved"), ("keyframe_id.state", "!=", "approved")]
+    )
+    for batch in split_every(1000, revisions.ids, history.browse):
+        batch._store_full_content()
+        env.flush_all()
+        cr.commit()  # pylint: disable=invalid-commit
+        env.invalidate_all()
+    execute_in_batches(
+        cr,
+        "DELETE FROM document_page_history WHERE {where}",
+        "document_page_history",
+        where="state != 'approved'",
+        commit=True,
+    )
@@ -1 +1,3 @@
 from . import document_page, document_page_history
+from . import document_page_approval_report
+from . import res_users
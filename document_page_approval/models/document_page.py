@@ -4,7 +4,9 @@
 
 from ast import literal_eval
 
-from odoo import api, fields, models
+from odoo import Command, _, api, fields, models, tools
+from odoo.exceptions import UserError
+from odoo.osv import expression
 
 
 class DocumentPage(models.Model):
@@ -45,63 +47,182 @@ class DocumentPage(models.Model):
     is_approval_required = fields.Boolean(
         "Approval required",
         help="If true, changes of this page require approval",
-        compute="_compute_is_approval_required",
-        recursive=True,
+        readonly=True,
+        index=True,
     )
 
-    am_i_approver = fields.Boolean(compute="_compute_am_i_approver")
+    am_i_approver = fields.Boolean(
+        compute="_compute_am_i_approver", search="_search_am_i_approver"
+    )
 
     approver_group_ids = fields.Many2many(
         "res.groups",
+        "document_page_approver_group_rel",
+        "page_id",
+        "group_id",
         string="Approver groups",
         help="Groups that can approve changes to this document",
-        compute="_compute_approver_group_ids",
-        recursive=True,
+        readonly=True,
     )
 
     # pylint: disable=W8113
     has_changes_pending_approval = fields.Boolean(
-        compute="_compute_has_changes_pending_approval",
+        compute="_compute_change_requests",
+        search="_search_has_changes_pending_approval",
         string="Has changes pending approval",
     )
 
+    pending_changes_count = fields.Integer(
+        compute="_compute_change_requests", string="Changes pending approval"
+    )
+
     user_has_drafts = fields.Boolean(
-        compute="_compute_user_has_drafts", string="User has drafts?"
+        compute="_compute_change_requests", string="User has drafts?"
     )
 
     def _valid_field_parameter(self, field, name):
         return name == "order" or super()._valid_field_parameter(field, name)
 
-    @api.depends("approval_required", "parent_id.is_approval_required")
-    def _compute_is_approval_required(self):
-        """Check if the document required approval based on his parents."""
-        for page in self:
-            res = page.approval_required
-            if page.parent_id:
-                res = res or page.parent_id.is_approval_required
-            page.is_approval_required = res
-
-    @api.depends("approver_gid", "parent_id.approver_group_ids")
-    def _compute_approver_group_ids(self):
-        """Compute the approver groups based on his parents."""
+    @api.model
+    def _get_inherited_approval_values(self, parent, approval_required, approver_gid):
+        """Approval settings of a page, from its own ones and its parent."""
+        groups = parent.approver_group_ids.ids
+        if approver_gid and approver_gid not in groups:
+            groups.append(approver_gid)
+        return {
+            "is_approval_required": bool(approval_required)
+            or parent.is_approval_required,
+            "approver_group_ids": [Command.set(groups)],
+        }
+
+    @api.onchange("parent_id", "approval_required", "approver_gid")
+    def _onchange_approval_inheritance(self):
         for page in self:
-            res = page.approver_gid
-            if page.parent_id:
-                res = res | page.parent_id.approver_group_ids
-            page.approver_group_ids = res
+            page.update(
+                self._get_inherited_approval_values(
+                    page.parent_id, page.approval_required, page.approver_gid.id
+                )
+            )
+
+    def _update_approval_inheritance(self):
+        """Store the approval settings inherited by these pages and their subtree.
+
+        Each page requires approval if a page of its path does, and gets the
+        approver groups of its path. All the pages of the subtrees are
+        updated with a few queries, whatever their depth.
+        """
+        self.flush_model(
+            ["parent_id", "parent_path", "approval_required", "approver_gid"]
+        )
+        pages = self.with_context(active_test=False).search(
+            [("id", "child_of", self.ids)]
+        )
+        if not pages:
+            return
+        page_ids = tuple(pages.ids)
+        self.env.cr.execute(
+            """
+            UPDATE document_page page
+            SET is_approval_required = EXISTS (
+                SELECT 1 FROM document_page parent
+                WHERE parent.approval_required
+                    AND page.parent_path LIKE parent.parent_path || '%%'
+            )
+            WHERE page.id IN %s
+            """,
+            [page_ids],
+        )
+        self.env.cr.execute(
+            "DELETE FROM document_page_approver_group_rel WHERE page_id IN %s",
+            [page_ids],
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO document_page_approver_group_rel (page_id, group_id)
+            SELECT DISTINCT page.id, parent.approver_gid
+            FROM document_page page
+            JOIN document_page parent
+                ON parent.approver_gid IS NOT NULL
+                AND page.parent_path LIKE parent.parent_path || '%%'
+            WHERE page.id IN %s
+            """,
+            [page_ids],
+        )
+        pages.invalidate_recordset(
+            ["is_approval_required", "approver_group_ids", "am_i_approver"]
+        )
+        self.env["document.page.history"].invalidate_model(
+            ["is_approval_required", "am_i_approver"]
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        parents = self.browse(
+            [vals["parent_id"] for vals in vals_list if vals.get("parent_id")]
+        )
+        for vals in vals_list:
+            # set before the content is saved, it may need approval
+            vals.update(
+                self._get_inherited_approval_values(
+                    self.browse(vals.get("parent_id")).with_prefetch(parents.ids),
+                    vals.get("approval_required"),
+                    vals.get("approver_gid"),
+                )
+            )
+        return super().create(vals_list)
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {"parent_id", "approval_required", "approver_gid"} & set(vals):
+            self._update_approval_inheritance()
+        return res
 
     @api.depends("is_approval_required", "approver_group_ids")
+    @api.depends_context("uid")
     def _compute_am_i_approver(self):
         """Check if the current user can approve changes to this page."""
         for rec in self:
             rec.am_i_approver = rec.can_user_approve_this_page(self.env.user)
 
+    def _search_am_i_approver(self, operator, value):
+        if operator not in ("=", "!=") or not isinstance(value, bool):
+            raise UserError(_("Unsupported search on approvers."))
+        user = self.env.user
+        if user.has_group("document_page.group_document_manager"):
+            domain = expression.TRUE_DOMAIN
+        elif not user.has_group("document_page_approval.group_document_approver_user"):
+            domain = [("is_approval_required", "=", False)]
+        else:
+            domain = [
+                "|",
+                "|",
+                ("is_approval_required", "=", False),
+                ("approver_group_ids", "=", False),
+                ("approver_group_ids", "in", user.groups_id.ids),
+            ]
+        if (operator == "=") != value:
+            domain = ["!"] + expression.normalize_domain(domain)
+        return domain
+
     def can_user_approve_this_page(self, user):
         """Check if a user can approve this page."""
         self.ensure_one()
         # if it's not required, anyone can approve
         if not self.is_approval_required:
             return True
+        return self._user_can_approve(
+            user.id, tuple(sorted(self.approver_group_ids.ids))
+        )
+
+    @api.model
+    @tools.ormcache("user_id", "group_ids")
+    def _user_can_approve(self, user_id, group_ids):
+        """Whether a user can approve the pages with these approver groups.
+
+        The answer is cached per user and group set, changes of group
+        membership clear the caches.
+        """
+        user = self.env["res.users"].sudo().browse(user_id)
         # if user belongs to 'Knowledge / Manager', he can approve anything
         if user.has_group("document_page.group_document_manager"):
             return True
@@ -109,32 +230,85 @@ class DocumentPage(models.Model):
         if not user.has_group("document_page_approval.group_document_approver_user"):
             return False
         # if there aren't any approver_groups_defined, user can approve
-        if not self.approver_group_ids:
+        if not group_ids:
             return True
         # to approve, user must belong to any of the approver groups
-        return len(user.groups_id & self.approver_group_ids) > 0
+        return bool(set(user.groups_id.ids) & set(group_ids))
 
-    def _compute_has_changes_pending_approval(self):
-        history = self.env["document.page.history"]
-        for rec in self:
-            changes = history.search_count(
-                [("page_id", "=", rec.id), ("state", "=", "to approve")]
+    @api.model
+    @tools.ormcache("group_ids")
+    def _get_approver_partner_ids(self, group_ids):
+        """Partners of the approvers of the pages with these approver groups.
+
+        The result is cached per group set, changes of group membership and
+        the creation or archiving of users clear the caches.
+        """
+        approver_gid = self.env.ref(
+            "document_page_approval.group_document_approver_user"
+        )
+        users = (
+            self.env["res.users"]
+            .sudo()
+            .search(
+                [
+                    ("groups_id", "in", list(group_ids)),
+                    ("groups_id", "in", approver_gid.id),
+                ]
             )
-            rec.has_changes_pending_approval = changes > 0
+        )
+        return tuple(users.partner_id.ids)
 
-    def _compute_user_has_drafts(self):
-        history = self.env["document.page.history"]
+    def _compute_change_requests(self):
+        """Count the pending and draft change requests of all pages at once."""
+        counts = self._get_change_request_counts()
         for rec in self:
-            changes = history.search_count(
-                [("page_id", "=", rec.id), ("state", "=", "draft")]
-            )
-            rec.user_has_drafts = changes > 0
+            pending = counts.get((rec.id, "to approve"), 0)
+            rec.pending_changes_count = pending
+            rec.has_changes_pending_approval = pending > 0
+            rec.user_has_drafts = counts.get((rec.id, "draft"), 0) > 0
+
+    def _get_change_request_counts(self):
+        """Return the number of change requests per page and state, as a dict."""
+        page_ids = [page_id for page_id in self.ids if isinstance(page_id, int)]
+        if not page_ids:
+            return {}
+        groups = self.env["document.page.history"]._read_group(
+            [("page_id", "in", page_ids), ("state", "in", ("to approve", "draft"))],
+            ["page_id", "state"],
+            ["page_id", "state"],
+            lazy=False,
+        )
+        return {
+            (group["page_id"][0], group["state"]): group["__count"] for group in groups
+        }
+
+    def _search_has_changes_pending_approval(self, operator, value):
+        if operator not in ("=", "!=") or not isinstance(value, bool):
+            raise UserError(_("Unsupported search on pending changes."))
+        query = self.env["document.page.history"]._search(
+            [("state", "=", "to approve"), ("page_id", "!=", False)]
+        )
+        sql = query.subselect('"document_page_history"."page_id"')
+        if (operator == "=") == value:
+            return [("id", "inselect", sql)]
+        return [("id", "not inselect", sql)]
 
     def _create_history(self, vals):
         res = super()._create_history(vals)
         res.action_to_approve()
         return res
 
+    @api.model
+    def _prepare_import_history_vals(self, page, content):
+        """Imported content is approved."""
+        vals = super()._prepare_import_history_vals(page, content)
+        vals.update(
+            state="approved",
+            approved_uid=self.env.uid,
+            approved_date=fields.Datetime.now(),
+        )
+        return vals
+
     def action_changes_pending_approval(self):
         self.ensure_one()
         action = self.env.ref("document_page_approval.action_change_requests")
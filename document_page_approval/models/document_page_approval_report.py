@@ -0,0 +1,121 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from datetime import timedelta
+
+from odoo import api, fields, models, tools
+
+
+class DocumentPageApprovalReport(models.Model):
+    """Change requests per category and approver group, to follow the
+    approval queue."""
+
+    _name = "document.page.approval.report"
+    _description = "Change Requests Analysis"
+    _auto = False
+    _order = "request_date DESC"
+    _rec_name = "history_id"
+
+    history_id = fields.Many2one(
+        "document.page.history", "Change Request", readonly=True
+    )
+    page_id = fields.Many2one("document.page", "Page", readonly=True)
+    category_id = fields.Many2one("document.page", "Category", readonly=True)
+    approver_group_id = fields.Many2one("res.groups", "Approver Group", readonly=True)
+    state = fields.Selection(
+        [
+            ("to approve", "Pending Approval"),
+            ("approved", "Approved"),
+            ("cancelled", "Cancelled"),
+        ],
+        "Status",
+        readonly=True,
+    )
+    request_date = fields.Datetime("Requested On", readonly=True)
+    approved_date = fields.Datetime("Approved On", readonly=True)
+    approval_delay = fields.Float(
+        "Hours to Approval", group_operator="avg", readonly=True
+    )
+    pending_age = fields.Float("Hours Pending", group_operator="max", readonly=True)
+
+    def _query(self):
+        # the id is built from the grouped keys so that domains keep being
+        # pushed down to the indexes of the history table
+        return """
+            SELECT (history.id::bigint << 20) + COALESCE(rel.group_id, 0) AS id,
+                history.id AS history_id,
+                history.page_id,
+                page.parent_id AS category_id,
+                rel.group_id AS approver_group_id,
+                history.state,
+                history.create_date AS request_date,
+                history.approved_date,
+                EXTRACT(EPOCH FROM history.approved_date - history.create_date)
+                    / 3600.0 AS approval_delay,
+                CASE WHEN history.state = 'to approve' THEN
+                    EXTRACT(EPOCH FROM NOW() AT TIME ZONE 'UTC' - history.create_date)
+                        / 3600.0
+                END AS pending_age
+            FROM document_page_history history
+            JOIN document_page page ON page.id = history.page_id
+            LEFT JOIN document_page_approver_group_rel rel ON rel.page_id = page.id
+            WHERE page.is_approval_required AND history.state != 'draft'
+        """
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        # pylint: disable=sql-injection
+        self.env.cr.execute(
+            f"CREATE OR REPLACE VIEW {self._table} AS ({self._query()})"
+        )
+
+    @api.model
+    def get_approval_metrics(self, window_days=30):
+        """Return the approval queue per category and approver group.
+
+        Each line gives the number of pending change requests, the date of
+        the oldest one and the median delay of the approvals of the last
+        ``window_days`` days, in hours.
+        """
+        self.check_access_rights("read")
+        since = fields.Datetime.now() - timedelta(days=window_days)
+        # the pages hidden from the user by record rules are left out
+        readable_query, readable_params = (
+            self.env["document.page"]._search([]).subselect()
+        )
+        # pylint: disable=sql-injection
+        self.env.cr.execute(
+            f"""
+            SELECT category_id, approver_group_id,
+                COUNT(*) FILTER (WHERE state = 'to approve'),
+                MIN(request_date) FILTER (WHERE state = 'to approve'),
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY approval_delay)
+                    FILTER (WHERE state = 'approved')
+            FROM {self._table}
+            WHERE (state = 'to approve'
+                    OR (state = 'approved' AND approved_date >= %s))
+                AND page_id IN ({readable_query})
+                AND (category_id IS NULL OR category_id IN ({readable_query}))
+            GROUP BY category_id, approver_group_id
+            ORDER BY category_id, approver_group_id
+            """,
+            [since, *readable_params, *readable_params],
+        )
+        rows = self.env.cr.fetchall()
+        categories = self.env["document.page"].browse(
+            list({row[0] for row in rows if row[0]})
+        )
+        groups = self.env["res.groups"].browse(list({row[1] for row in rows if row[1]}))
+        category_names = dict(categories.sudo().name_get())
+        group_names = dict(groups.sudo().name_get())
+        return [
+            {
+                "category_id": category_id,
+                "category": category_names.get(category_id, False),
+                "approver_group_id": group_id,
+                "approver_group": group_names.get(group_id, False),
+                "pending_count": pending_count,
+                "oldest_pending_date": fields.Datetime.to_string(oldest),
+                "median_approval_delay": median,
+            }
+            for category_id, group_id, pending_count, oldest, median in rows
+        ]
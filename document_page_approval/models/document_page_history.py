@@ -1,10 +1,18 @@
 # Copyright (C) 2013 Savoir-faire Linux (<http://www.savoirfairelinux.com>).
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+import logging
+from collections import defaultdict
+
+from markupsafe import Markup
+
+from odoo import api, fields, models, tools
 from odoo.exceptions import UserError
+from odoo.tools import groupby
 from odoo.tools.translate import _
 
+_logger = logging.getLogger(__name__)
+
 
 class DocumentPageHistory(models.Model):
     """Useful to manage edition's workflow on a document."""
@@ -23,12 +31,30 @@ class DocumentPageHistory(models.Model):
         "Status",
         default="draft",
         readonly=True,
+        index=True,
     )
 
-    approved_date = fields.Datetime()
+    approved_date = fields.Datetime(index=True)
 
     approved_uid = fields.Many2one("res.users", "Approved by")
 
+    mass_action = fields.Selection(
+        [("approve", "Approve"), ("cancel", "Cancel")],
+        readonly=True,
+        copy=False,
+        index=True,
+        help="Action waiting to be applied by the background job.",
+    )
+
+    mass_action_uid = fields.Many2one("res.users", readonly=True, copy=False)
+
+    approval_notification_pending = fields.Boolean(
+        readonly=True,
+        copy=False,
+        index=True,
+        help="The approvers still have to be notified by the background job.",
+    )
+
     is_approval_required = fields.Boolean(
         related="page_id.is_approval_required", string="Approval required"
     )
@@ -54,13 +80,11 @@ class DocumentPageHistory(models.Model):
             rec.write({"state": "draft"})
 
     def action_to_approve(self):
-        """Set a change request as to approve"""
-        template = self.env.ref(
-            "document_page_approval.email_template_new_draft_need_approval"
-        )
-        approver_gid = self.env.ref(
-            "document_page_approval.group_document_approver_user"
-        )
+        """Set change requests as to approve.
+
+        Approvers are subscribed at once, the mails asking for their approval
+        are rendered and sent by a background job.
+        """
         for rec in self:
             if rec.state != "draft":
                 raise UserError(_("Can't approve pages in '%s' state.") % rec.state)
@@ -71,21 +95,61 @@ class DocumentPageHistory(models.Model):
                         "Only owners or approvers can request approval."
                     )
                 )
-            # request approval
-            if rec.is_approval_required:
-                rec.write({"state": "to approve"})
-                guids = [g.id for g in rec.page_id.approver_group_ids]
-                users = self.env["res.users"].search(
-                    [("groups_id", "in", guids), ("groups_id", "in", approver_gid.id)]
+        # request approval
+        to_approve = self.filtered("is_approval_required")
+        if to_approve:
+            to_approve.write(
+                {"state": "to approve", "approval_notification_pending": True}
+            )
+            to_approve._subscribe_approvers()
+            self.env.ref(
+                "document_page_approval.ir_cron_send_approval_notifications"
+            )._trigger()
+        # auto-approve if approval is not required
+        if self - to_approve:
+            (self - to_approve).action_approve()
+
+    def _subscribe_approvers(self):
+        """Subscribe the approvers, once per set of approver groups."""
+        page_model = self.env["document.page"]
+        for group_ids, records in groupby(
+            self, key=lambda rec: tuple(sorted(rec.page_id.approver_group_ids.ids))
+        ):
+            partner_ids = page_model._get_approver_partner_ids(group_ids)
+            if partner_ids:
+                self.browse([rec.id for rec in records]).message_subscribe(
+                    partner_ids=list(partner_ids)
                 )
-                rec.message_subscribe(partner_ids=users.mapped("partner_id").ids)
-                rec.message_post_with_template(template.id)
-            else:
-                # auto-approve if approval is not required
-                rec.action_approve()
+
+    @api.model
+    def _cron_send_approval_notifications(self, batch_size=100, commit=False):
+        """Ask the approvers to approve the change requests, in batches of
+        ``batch_size``."""
+        template = self.env.ref(
+            "document_page_approval.email_template_new_draft_need_approval"
+        )
+        while True:
+            requests = self.search(
+                [("approval_notification_pending", "=", True)],
+                order="id",
+                limit=batch_size,
+            )
+            if not requests:
+                break
+            requests.write({"approval_notification_pending": False})
+            for rec in requests.filtered(lambda rec: rec.state == "to approve"):
+                rec.message_post_with_template(
+                    template.id, author_id=rec.create_uid.partner_id.id
+                )
+            _logger.info("Sent %d approval notifications", len(requests))
+            if commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
 
     def action_approve(self):
-        """Set a change request as approved."""
+        """Set change requests as approved.
+
+        Large selections are approved by a background job.
+        """
         for rec in self:
             if rec.state not in ["draft", "to approve"]:
                 raise UserError(_("Can't approve page in '%s' state.") % rec.state)
@@ -99,43 +163,186 @@ class DocumentPageHistory(models.Model):
                         [g.display_name for g in rec.page_id.approver_group_ids]
                     )
                 )
-            # Update state
-            rec.write(
-                {
-                    "state": "approved",
-                    "approved_date": fields.datetime.now(),
-                    "approved_uid": self.env.uid,
-                }
-            )
-            # Trigger computed field update
-            rec.page_id._compute_history_head()
-            # Notify state change
-            rec.message_post(
-                subtype_xmlid="mail.mt_comment",
-                body=_("Change request has been approved by %s.")
-                % (self.env.user.name),
-            )
-            # Notify followers a new version is available
-            rec.page_id.message_post(
-                subtype_xmlid="mail.mt_comment",
-                body=_("New version of the document %s approved.") % (rec.page_id.name),
-            )
+        if len(self) > self._get_mass_action_limit():
+            return self._queue_mass_action("approve")
+        self._approve()
 
     def action_cancel(self):
-        """Set a change request as cancelled."""
+        """Set change requests as cancelled.
+
+        Large selections are cancelled by a background job.
+        """
+        if len(self) > self._get_mass_action_limit():
+            return self._queue_mass_action("cancel")
+        self._cancel()
+
+    def _approve(self):
+        """Approve the change requests with a single write per batch."""
+        if not self:
+            return
+        self.write(
+            {
+                "state": "approved",
+                "approved_date": fields.datetime.now(),
+                "approved_uid": self.env.uid,
+            }
+        )
+        # Trigger computed field update, once per page
+        pages = self.page_id
+        pages._compute_history_head()
+        # Log state changes without notifying followers one by one
+        self._message_log_batch(
+            {
+                rec.id: Markup(_("Change request has been approved by %s."))
+                % self.env.user.name
+                for rec in self
+            }
+        )
+        pages._message_log_batch(
+            {
+                page.id: Markup(_("New version of the document %s approved."))
+                % page.name
+                for page in pages
+            }
+        )
+        self._notify_digest(_("New versions of documents approved"))
+
+    def _cancel(self):
+        """Cancel the change requests with a single write per batch."""
+        if not self:
+            return
         self.write({"state": "cancelled"})
+        self._message_log_batch(
+            {
+                rec.id: Markup(
+                    _("Change request <b>%(name)s</b> has been cancelled by %(user)s.")
+                )
+                % {"name": rec.display_name, "user": self.env.user.name}
+                for rec in self
+            }
+        )
+        self._notify_digest(_("Change requests cancelled"))
+
+    def _notify_digest(self, subject):
+        """Send a single notification to each follower of the change requests
+        or of their pages, listing the change requests they are concerned by.
+
+        Followers concerned by the same change requests share one message.
+        """
+        requests_by_page = defaultdict(set)
         for rec in self:
-            rec.message_post(
-                subtype_xmlid="mail.mt_comment",
-                body=_("Change request <b>%(name)s</b> has been cancelled by %(user)s.")
-                % ({"name": rec.display_name, "user": self.env.user.name}),
+            requests_by_page[rec.page_id.id].add(rec.id)
+        followers = (
+            self.env["mail.followers"]
+            .sudo()
+            .search(
+                [
+                    "|",
+                    "&",
+                    ("res_model", "=", self._name),
+                    ("res_id", "in", self.ids),
+                    "&",
+                    ("res_model", "=", "document.page"),
+                    ("res_id", "in", list(requests_by_page)),
+                ]
+            )
+        )
+        requests_by_partner = defaultdict(set)
+        for follower in followers:
+            if follower.res_model == self._name:
+                requests_by_partner[follower.partner_id.id].add(follower.res_id)
+            else:
+                requests_by_partner[follower.partner_id.id] |= requests_by_page[
+                    follower.res_id
+                ]
+        requests_by_partner.pop(self.env.user.partner_id.id, None)
+        partners_by_requests = defaultdict(list)
+        for partner_id, request_ids in requests_by_partner.items():
+            partners_by_requests[frozenset(request_ids)].append(partner_id)
+        for request_ids, partner_ids in partners_by_requests.items():
+            requests = self.browse(sorted(request_ids))
+            body = Markup("<p>%s</p><ul>%s</ul>") % (
+                subject,
+                Markup().join(
+                    Markup('<li><a href="%s">%s</a>: %s</li>')
+                    % (rec.page_url, rec.page_id.name, rec.display_name)
+                    for rec in requests
+                ),
             )
+            self.env["mail.thread"].message_notify(
+                partner_ids=partner_ids,
+                subject=subject,
+                body=body,
+                author_id=self.env.user.partner_id.id,
+            )
+
+    @api.model
+    def _get_mass_action_limit(self):
+        """Number of change requests above which actions run in background."""
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("document_page_approval.mass_action_limit", 50)
+        )
+
+    def _queue_mass_action(self, action):
+        """Mark the change requests to be processed by the background job."""
+        self.sudo().write({"mass_action": action, "mass_action_uid": self.env.uid})
+        self.env.ref("document_page_approval.ir_cron_process_mass_actions")._trigger()
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Change Requests"),
+                "message": _("%s change requests will be processed in background.")
+                % len(self),
+                "type": "info",
+                "sticky": False,
+            },
+        }
+
+    @api.model
+    def _cron_process_mass_actions(self, batch_size=500, commit=False):
+        """Approve or cancel the queued change requests as the user who
+        requested it, in batches of ``batch_size``."""
+        while True:
+            pending = self.sudo().search(
+                [("mass_action", "!=", False)], order="id", limit=batch_size
+            )
+            if not pending:
+                break
+            for (action, user), records in groupby(
+                pending, key=lambda rec: (rec.mass_action, rec.mass_action_uid)
+            ):
+                requests = self.sudo().browse([rec.id for rec in records])
+                requests.write({"mass_action": False, "mass_action_uid": False})
+                requests = requests.with_user(user)
+                if action == "approve":
+                    requests.filtered(
+                        lambda rec: rec.state in ("draft", "to approve")
+                    )._approve()
+                else:
+                    requests._cancel()
+            _logger.info("Processed %d queued change request actions", len(pending))
+            if commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
 
     def action_cancel_and_draft(self):
         """Set a change request as draft, cancelling it first"""
-        self.action_cancel()
+        self._cancel()
         self.action_draft()
 
+    def init(self):
+        super().init()
+        # approval queue analysis only scans the pending change requests
+        tools.create_index(
+            self.env.cr,
+            "document_page_history_pending_index",
+            self._table,
+            ["page_id", "create_date"],
+            where="state = 'to approve'",
+        )
+
     def _compute_am_i_owner(self):
         """Check if current user is the owner"""
         for rec in self:
@@ -154,15 +361,17 @@ class DocumentPageHistory(models.Model):
                 "{}/web#db={}&id={}&" "model=document.page.history"
             ).format(base_url, self.env.cr.dbname, page.id)
 
-    def _compute_diff(self):
-        """Shows a diff between this version and the previous version"""
-        history = self.env["document.page.history"]
-        for rec in self:
-            domain = [("page_id", "=", rec.page_id.id), ("state", "=", "approved")]
-            if rec.approved_date:
-                domain.append(("approved_date", "<", rec.approved_date))
-            prev = history.search(domain, limit=1, order="approved_date DESC")
-            if prev:
-                rec.diff = self._get_diff(prev.id, rec.id)
-            else:
-                rec.diff = self._get_diff(False, rec.id)
+    def _get_predecessor_domain(self):
+        """Changes are compared to the approved revisions only."""
+        return super()._get_predecessor_domain() + [("state", "=", "approved")]
+
+    def _get_predecessor_key(self):
+        """Not approved changes are compared to the current approved content."""
+        self.ensure_one()
+        return (self.approved_date, self.id) if self.approved_date else None
+
+    def _get_compaction_protected(self):
+        """Approved revisions and pending changes are always kept."""
+        return super()._get_compaction_protected() | self.filtered(
+            lambda rev: rev.state in ("approved", "to approve")
+        )
@@ -0,0 +1,24 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class ResUsers(models.Model):
+    _inherit = "res.users"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        # approvers of the pages are cached per approver groups
+        if any(
+            user.has_group("document_page_approval.group_document_approver_user")
+            for user in users
+        ):
+            self.env["document.page"].clear_caches()
+        return users
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "active" in vals:
+            self.env["document.page"].clear_caches()
+        return res
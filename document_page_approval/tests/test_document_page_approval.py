@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from odoo import fields
 from odoo.tests import common
 
 
@@ -48,6 +51,79 @@ class TestDocumentPageApproval(common.TransactionCase):
         self.assertTrue(page.has_changes_pending_approval)
         self.assertEqual(len(page.history_ids), 0)
 
+    def test_change_request_counts(self):
+        pages = self.page1 | self.page2
+        self.assertEqual(self.page2.pending_changes_count, 1)
+        self.assertFalse(self.page1.has_changes_pending_approval)
+        self.assertEqual(
+            self.page_obj.search(
+                [("id", "in", pages.ids), ("has_changes_pending_approval", "=", True)]
+            ),
+            self.page2,
+        )
+        self.assertEqual(
+            self.page_obj.search(
+                [("id", "in", pages.ids), ("has_changes_pending_approval", "=", False)]
+            ),
+            self.page1,
+        )
+        self.history_obj.create({"page_id": self.page2.id, "content": "Draft"})
+        pages.invalidate_recordset()
+        self.assertTrue(self.page2.user_has_drafts)
+        self.assertFalse(self.page1.user_has_drafts)
+
+    def test_approval_inheritance(self):
+        subcategory = self.page_obj.create(
+            {"name": "Subcategory", "type": "category", "parent_id": self.category1.id}
+        )
+        page = self.page_obj.create(
+            {"name": "Deep page", "parent_id": subcategory.id, "content": "Deep"}
+        )
+        self.assertFalse(page.is_approval_required)
+        self.category1.write(
+            {"approval_required": True, "approver_gid": self.approver_gid.id}
+        )
+        self.assertTrue(page.is_approval_required)
+        self.assertEqual(page.approver_group_ids, self.approver_gid)
+        self.assertIn(page, self.page_obj.search([("is_approval_required", "=", True)]))
+        subcategory.parent_id = self.category2
+        self.assertTrue(page.is_approval_required)
+        self.category1.approval_required = False
+        self.assertTrue(page.is_approval_required)
+        subcategory.parent_id = self.category1
+        self.assertFalse(page.is_approval_required)
+        self.assertEqual(page.approver_group_ids, self.approver_gid)
+        subcategory.parent_id = self.category2
+        self.category2.unlink()
+        self.assertFalse(subcategory.parent_id)
+        self.assertFalse(page.is_approval_required)
+
+    def test_am_i_approver_search(self):
+        user3 = self.env["res.users"].create(
+            {
+                "name": "Test user 3",
+                "login": "Test user 3",
+                "groups_id": [
+                    (6, 0, [self.env.ref("document_knowledge.group_document_user").id])
+                ],
+            }
+        )
+        pages = self.page1 | self.page2
+        domain = [("id", "in", pages.ids), ("am_i_approver", "=", True)]
+        self.assertEqual(self.page_obj.with_user(self.user2).search(domain), pages)
+        self.assertEqual(self.page_obj.with_user(user3).search(domain), self.page1)
+        self.assertFalse(self.page2.with_user(user3).am_i_approver)
+        self.assertEqual(
+            self.history_obj.with_user(self.user2).search(
+                [("page_id", "=", self.page2.id), ("am_i_approver", "=", True)]
+            ),
+            self.history_obj.search([("page_id", "=", self.page2.id)]),
+        )
+        # group changes are taken into account
+        user3.groups_id = [(4, self.approver_gid.id)]
+        self.assertEqual(self.page_obj.with_user(user3).search(domain), pages)
+        self.assertTrue(self.page2.with_user(user3).am_i_approver)
+
     def test_change_request_approve(self):
         page = self.page2
         chreq = self.history_obj.search(
@@ -136,6 +212,140 @@ class TestDocumentPageApproval(common.TransactionCase):
         self.assertEqual(page.approved_date, chreq.approved_date)
         self.assertEqual(page.approved_uid, chreq.approved_uid)
 
+    def test_approval_notification(self):
+        chreq = self.history_obj.search(
+            [("page_id", "=", self.page2.id), ("state", "=", "to approve")]
+        )
+        self.assertTrue(chreq.approval_notification_pending)
+        messages = chreq.message_ids
+        self.history_obj._cron_send_approval_notifications()
+        self.assertFalse(chreq.approval_notification_pending)
+        self.assertEqual(len(chreq.message_ids - messages), 1)
+        self.assertIn(
+            self.user2.partner_id.id,
+            self.page_obj._get_approver_partner_ids((self.approver_gid.id,)),
+        )
+
+    def test_approver_partners_cache(self):
+        group_ids = (self.approver_gid.id,)
+        self.assertIn(
+            self.user2.partner_id.id, self.page_obj._get_approver_partner_ids(group_ids)
+        )
+        user3 = self.env["res.users"].create(
+            {
+                "name": "Test user 3",
+                "login": "Test user 3",
+                "groups_id": [
+                    (6, 0, [self.env.ref("base.group_user").id, self.approver_gid.id])
+                ],
+            }
+        )
+        self.assertIn(
+            user3.partner_id.id, self.page_obj._get_approver_partner_ids(group_ids)
+        )
+        self.user2.active = False
+        self.assertNotIn(
+            self.user2.partner_id.id, self.page_obj._get_approver_partner_ids(group_ids)
+        )
+
+    def test_mass_approve(self):
+        pages = self.page2 | self.page_obj.create(
+            {
+                "name": "Another page requiring approval",
+                "parent_id": self.category2.id,
+                "content": "Another content",
+            }
+        )
+        pages.message_subscribe(partner_ids=self.user2.partner_id.ids)
+        requests = self.history_obj.search(
+            [("page_id", "in", pages.ids), ("state", "=", "to approve")]
+        )
+        self.assertEqual(len(requests), 2)
+        messages = self.env["mail.message"].search([])
+        requests.action_approve()
+        self.assertEqual(set(requests.mapped("state")), {"approved"})
+        self.assertEqual(pages.mapped("history_head"), requests)
+        digests = self.env["mail.message"].search(
+            [
+                ("id", "not in", messages.ids),
+                ("partner_ids", "in", self.user2.partner_id.id),
+            ]
+        )
+        self.assertEqual(len(digests), 1)
+
+    def test_mass_approve_background(self):
+        self.env["ir.config_parameter"].set_param(
+            "document_page_approval.mass_action_limit", 0
+        )
+        requests = self.history_obj.search(
+            [("page_id", "=", self.page2.id), ("state", "=", "to approve")]
+        )
+        action = requests.action_approve()
+        self.assertEqual(action["tag"], "display_notification")
+        self.assertEqual(requests.state, "to approve")
+        self.assertEqual(requests.mass_action, "approve")
+        self.history_obj._cron_process_mass_actions()
+        self.assertEqual(requests.state, "approved")
+        self.assertFalse(requests.mass_action)
+        self.assertEqual(self.page2.history_head, requests)
+
+    def test_approval_metrics(self):
+        self.env.flush_all()
+        report = self.env["document.page.approval.report"]
+        metrics = {line["category_id"]: line for line in report.get_approval_metrics()}
+        line = metrics[self.category2.id]
+        self.assertEqual(line["approver_group_id"], self.approver_gid.id)
+        self.assertEqual(line["pending_count"], 1)
+        self.assertTrue(line["oldest_pending_date"])
+        self.history_obj.search(
+            [("page_id", "=", self.page2.id), ("state", "=", "to approve")]
+        ).action_approve()
+        self.env.flush_all()
+        metrics = {line["category_id"]: line for line in report.get_approval_metrics()}
+        line = metrics[self.category2.id]
+        self.assertEqual(line["pending_count"], 0)
+        self.assertIsNotNone(line["median_approval_delay"])
+        # pages hidden by record rules are left out
+        self.env["ir.rule"].create(
+            {
+                "name": "Hide page 2",
+                "model_id": self.env.ref("document_page.model_document_page").id,
+                "domain_force": f"[('id', '!=', {self.page2.id})]",
+            }
+        )
+        metrics = report.with_user(self.user2).get_approval_metrics()
+        self.assertNotIn(self.category2.id, [line["category_id"] for line in metrics])
+
+    def test_import_approved(self):
+        self.page_obj._import_tree(
+            [{"name": "Imported page", "content": "<p>Imported</p>"}],
+            parent=self.category2,
+        )
+        page = self.page_obj.search([("name", "=", "Imported page")])
+        self.assertEqual(page.history_head.state, "approved")
+        self.assertEqual(page.content, "<p>Imported</p>")
+        self.assertFalse(page.has_changes_pending_approval)
+
+    def test_compact_keeps_approved(self):
+        self.category2.history_keep_days = 1
+        page = self.page2
+        history = self.history_obj.search([("page_id", "=", page.id)])
+        history.action_approve()
+        page.write({"content": "Draft content"})
+        drafts = self.history_obj.search(
+            [("page_id", "=", page.id), ("state", "!=", "approved")]
+        )
+        drafts.action_cancel()
+        page.write({"content": "Other draft content"})
+        self.env.cr.execute(
+            "UPDATE document_page_history SET create_date = %s WHERE page_id = %s",
+            [fields.Datetime.now() - timedelta(days=7), page.id],
+        )
+        self.env.invalidate_all()
+        removed = self.history_obj._get_compactable_revisions(page)
+        self.assertTrue(removed)
+        self.assertFalse(removed.filtered(lambda rev: rev.state == "approved"))
+
     def test_get_approvers_guids(self):
         """Get approver guids."""
         page = self.page2
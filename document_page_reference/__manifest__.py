@@ -5,19 +5,23 @@
     "name": "Document Page Reference",
     "summary": """
         Include references on document pages""",
-    "version": "16.0.1.0.1",
+    "version": "16.0.1.2.0",
     "license": "AGPL-3",
     "author": "Creu Blanca,Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/knowledge",
     "depends": ["document_page", "web_editor"],
     "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "views/document_page.xml",
         "views/report_document_page.xml",
+        "views/res_config_settings.xml",
     ],
     "assets": {
         "web.assets_backend": [
             "document_page_reference/static/src/js/**/*",
         ],
     },
+    "post_init_hook": "post_init_hook",
     "maintainers": ["etobella"],
 }
@@ -0,0 +1,11 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import http
+from odoo.http import request
+
+
+class DocumentPageReferenceController(http.Controller):
+    @http.route("/document_page_reference/complete", type="json", auth="user")
+    def complete_reference(self, term="", limit=10):
+        """Return the references matching a partial code, for the editor."""
+        return request.env["document.page"].complete_reference(term, limit=limit)
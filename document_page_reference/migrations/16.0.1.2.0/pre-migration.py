@@ -0,0 +1,41 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    # References used to be unique among the pages visible to the user only,
+    # duplicates are renamed so that the unique constraint can be created
+    cr.execute(
+        """
+        SELECT reference, array_agg(id ORDER BY active DESC, id)
+        FROM document_page
+        WHERE reference IS NOT NULL
+        GROUP BY reference
+        HAVING COUNT(*) > 1
+        """
+    )
+    duplicates = cr.fetchall()
+    if not duplicates:
+        return
+    cr.execute("SELECT reference FROM document_page WHERE reference IS NOT NULL")
+    taken = {row[0] for row in cr.fetchall()}
+    for reference, page_ids in duplicates:
+        for page_id in page_ids[1:]:
+            candidate, number = reference, 2
+            while candidate in taken:
+                candidate = f"{reference}_{number}"
+                number += 1
+            taken.add(candidate)
+            cr.execute(
+                "UPDATE document_page SET reference = %s WHERE id = %s",
+                [candidate, page_id],
+            )
+            _logger.warning(
+                "Duplicate reference %r of page %d renamed to %r",
+                reference,
+                page_id,
+                candidate,
+            )
@@ -1 +1,4 @@
 from . import document_page
+from . import document_page_history
+from . import document_page_reference_link
+from . import res_config_settings
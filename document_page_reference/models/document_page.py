@@ -1,20 +1,77 @@
 # Copyright 2019 Creu Blanca
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import functools
 import logging
+import threading
+import time
+from collections import defaultdict
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
 from odoo.tools.misc import html_escape
 
+from odoo.addons.document_page.tools import SizedLRUCache, compute_digest
 from odoo.addons.http_routing.models.ir_http import slugify
 
 _logger = logging.getLogger(__name__)
 
+# Compiled templates of the pages, shared by the requests served by this worker
+template_cache = SizedLRUCache(16 * 1024 * 1024)
+
+# Resources left to the template being rendered by the current thread
+render_budget = threading.local()
+
+
+class RenderLimitError(Exception):
+    """A template needs more resources than allowed to render."""
+
+
+class RenderTimeoutError(RenderLimitError):
+    """A template takes too long to render, which depends on the load."""
+
+
+def spend_render_budget(count=1):
+    """Account for ``count`` operations of the template being rendered."""
+    budget = getattr(render_budget, "value", None)
+    if budget is None:
+        return
+    budget["operations"] -= count
+    if budget["operations"] < 0:
+        raise RenderLimitError(_("The template runs too many operations."))
+    if time.monotonic() > budget["deadline"]:
+        raise RenderTimeoutError(_("The template takes too long to render."))
+
+
+def check_render_size(args=(), result=None):
+    """Refuse the integer arguments asking for, and the results holding, more
+    items than the rendered content may have."""
+    budget = getattr(render_budget, "value", None)
+    if budget is None:
+        return result
+    if any(isinstance(arg, int) and arg > budget["max_size"] for arg in args) or (
+        hasattr(result, "__len__") and len(result) > budget["max_size"]
+    ):
+        raise RenderLimitError(_("The rendered content is too large."))
+    return result
+
+
+def bounded_filter(func):
+    """Wrap a filter of the sandbox so its arguments and result are checked."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        spend_render_budget()
+        check_render_size((*args, *kwargs.values()))
+        return check_render_size(result=func(*args, **kwargs))
+
+    return wrapper
+
+
 try:
     import re
 
-    from jinja2 import Undefined
+    from jinja2 import TemplateSyntaxError, Undefined, meta, nodes
     from jinja2.lexer import name_re as old_name_re
     from jinja2.sandbox import SandboxedEnvironment
 
@@ -29,6 +86,32 @@ try:
 
     class Environment(SandboxedEnvironment):
         context_class = Context
+        intercepted_binops = frozenset(["*", "**"])
+
+        def call(self, context, obj, /, *args, **kwargs):
+            spend_render_budget()
+            check_render_size((*args, *kwargs.values()))
+            return check_render_size(result=super().call(context, obj, *args, **kwargs))
+
+        def call_binop(self, context, operator, left, right):
+            spend_render_budget()
+            budget = getattr(render_budget, "value", None)
+            if budget is not None:
+                if operator == "*":
+                    sizes = [
+                        len(value) * other
+                        for value, other in ((left, right), (right, left))
+                        if hasattr(value, "__len__") and isinstance(other, int)
+                    ]
+                    if sizes and max(sizes) > budget["max_size"]:
+                        raise RenderLimitError(_("The rendered content is too large."))
+                elif (
+                    isinstance(left, int)
+                    and isinstance(right, int)
+                    and abs(left).bit_length() * right > 8 * budget["max_size"]
+                ):
+                    raise RenderLimitError(_("The rendered content is too large."))
+            return super().call_binop(context, operator, left, right)
 
     mako_template_env = Environment(
         block_start_string="<%",
@@ -42,6 +125,18 @@ try:
         trim_blocks=True,  # do not output newline after blocks
         autoescape=False,
     )
+    safe_range = mako_template_env.globals["range"]
+
+    def bounded_range(*args):
+        """Range of the sandbox, each item is accounted as an operation."""
+        rng = safe_range(*args)
+        spend_render_budget(len(rng))
+        return rng
+
+    mako_template_env.globals["range"] = bounded_range
+    mako_template_env.filters = {
+        name: bounded_filter(func) for name, func in mako_template_env.filters.items()
+    }
 except Exception:
     _logger.error("Jinja2 is not available")
 
@@ -49,10 +144,40 @@ except Exception:
 class DocumentPage(models.Model):
     _inherit = "document.page"
 
+    name = fields.Char(index="trigram")
     reference = fields.Char(
-        help="Used to find the document, it can contain letters, numbers and _"
+        help="Used to find the document, it can contain letters, numbers and _",
+        index="trigram",
     )
     content_parsed = fields.Html(compute="_compute_content_parsed")
+    content_rendered = fields.Html(
+        help="Content rendered for the revision in Rendered Revision",
+        sanitize=False,
+        readonly=True,
+        copy=False,
+    )
+    content_rendered_head_id = fields.Many2one(
+        "document.page.history",
+        "Rendered Revision",
+        readonly=True,
+        copy=False,
+        ondelete="set null",
+    )
+    content_rendered_outdated = fields.Boolean(
+        help="A document referenced by the rendered content has changed",
+        readonly=True,
+        copy=False,
+    )
+    backlink_ids = fields.Many2many(
+        "document.page",
+        string="Referenced By",
+        help="Pages whose current content references this one",
+        compute="_compute_backlink_ids",
+    )
+
+    _sql_constraints = [
+        ("reference_uniq", "unique(reference)", "Reference must be unique"),
+    ]
 
     def get_formview_action(self, access_uid=None):
         res = super().get_formview_action(access_uid)
@@ -60,24 +185,265 @@ class DocumentPage(models.Model):
         res["views"] = [(view_id, "form")]
         return res
 
-    @api.depends("history_head")
+    # Above this number of pages, contents are rendered again in background
+    _RENDER_SYNC_LIMIT = 50
+
+    @api.depends(
+        "history_head", "content_rendered_head_id", "content_rendered_outdated"
+    )
+    @api.depends_context("uid")
     def _compute_content_parsed(self):
+        stored = self._is_rendered_content_stored()
+        hidden = self._get_hidden_references() if stored else set()
         for record in self:
-            content = record.get_content()
-            if content == "<p>" and self.content != "<p>":
-                _logger.error(
-                    "Template from page with id = %s cannot be processed correctly"
-                    % self.id
-                )
-                content = self.content
-            record.content_parsed = content
+            if (
+                stored
+                and record._has_rendered_content()
+                and not hidden & record._get_head_reference_codes()
+            ):
+                record.content_parsed = record.content_rendered
+            else:
+                record.content_parsed = record._render_content()
+
+    def _get_head_reference_codes(self):
+        """Return the references used by the current revision of the page."""
+        self.ensure_one()
+        return set(self.sudo().history_head.reference_link_ids.mapped("code"))
+
+    def _get_hidden_references(self):
+        """Return the references used by the current revision of these pages
+        whose page exists but cannot be read by the current user.
+
+        Stored contents are rendered with superuser rights, they are not
+        served to the users who cannot read all the pages they reference.
+        """
+        if self.env.su:
+            return set()
+        codes = set(self.sudo().history_head.reference_link_ids.mapped("code"))
+        if not codes:
+            return set()
+        existing = self.sudo().search([("reference", "in", list(codes))])
+        readable = self.search([("reference", "in", list(codes))])
+        return set(existing.mapped("reference")) - set(readable.mapped("reference"))
+
+    def _render_content(self):
+        self.ensure_one()
+        content = self.get_content()
+        if content == "<p>" and self.content != "<p>":
+            _logger.error(
+                "Template from page with id = %s cannot be processed correctly"
+                % self.id
+            )
+            content = self.content
+        return content
+
+    @api.model
+    def _is_rendered_content_stored(self):
+        return bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("document_page_reference.store_rendered_content")
+        )
+
+    def _has_rendered_content(self):
+        """Whether the stored rendered content is the one of the current head."""
+        self.ensure_one()
+        return (
+            self.type == "content"
+            and bool(self.history_head)
+            and self.content_rendered_head_id == self.history_head
+            and not self.content_rendered_outdated
+        )
+
+    def _update_rendered_content(self):
+        """Render these pages and store the result for their current head."""
+        for record in self.sudo().filtered(lambda page: page.type == "content"):
+            record.write(
+                {
+                    "content_rendered": record._render_content(),
+                    "content_rendered_head_id": record.history_head.id,
+                    "content_rendered_outdated": False,
+                }
+            )
+
+    @api.model
+    def _get_pages_to_render(self, limit=None):
+        """Return the pages whose stored rendered content is missing or stale."""
+        self.flush_model(
+            [
+                "type",
+                "history_head",
+                "content_rendered_head_id",
+                "content_rendered_outdated",
+            ]
+        )
+        self.env.cr.execute(
+            """
+            SELECT id FROM document_page
+            WHERE type = 'content'
+                AND history_head IS NOT NULL
+                AND (content_rendered_outdated
+                    OR content_rendered_head_id IS DISTINCT FROM history_head)
+            ORDER BY id
+            LIMIT %s
+            """,
+            [limit],
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_render_content(self, batch_size=100):
+        """Store the rendered content of the pages missing it, in batches.
+
+        The cron is triggered again until none are left.
+        """
+        if not self._is_rendered_content_stored():
+            return
+        pages = self._get_pages_to_render(limit=batch_size)
+        if not pages:
+            return
+        pages._update_rendered_content()
+        self.env.ref("document_page_reference.ir_cron_render_content")._trigger()
+
+    @api.depends_context("uid")
+    def _compute_backlink_ids(self):
+        backlinks = self._get_backlinks(set(self.mapped("reference")) - {False})
+        for record in self:
+            record.backlink_ids = backlinks.get(record.reference, self.browse())
+
+    @api.model
+    def _get_backlinks(self, codes):
+        """Return the pages whose current revision uses each code, as a dict."""
+        if not codes:
+            return {}
+        self.env["document.page.reference.link"].flush_model()
+        self.flush_model(["history_head"])
+        # only the links of the current revisions, whatever the history size
+        self.env.cr.execute(
+            """
+            SELECT link.code, page.id
+            FROM document_page_reference_link link
+            JOIN document_page page ON page.history_head = link.history_id
+            WHERE link.code = ANY(%s)
+            """,
+            [list(codes)],
+        )
+        page_ids = defaultdict(set)
+        for code, page_id in self.env.cr.fetchall():
+            page_ids[code].add(page_id)
+        # only return the pages the user can read
+        readable = self.search([("id", "in", list(set().union(*page_ids.values())))])
+        return {
+            code: readable.filtered(lambda page, ids=ids: page.id in ids)
+            for code, ids in page_ids.items()
+        }
+
+    def _get_referencing_pages(self):
+        """Return the pages whose current revision references these ones."""
+        codes = set(self.mapped("reference")) - {False}
+        pages = self.browse()
+        for backlinks in self.sudo()._get_backlinks(codes).values():
+            pages |= backlinks
+        return pages.with_env(self.env)
+
+    def _invalidate_rendered_content(self):
+        """Drop the rendered content of these pages, a reference changed.
+
+        Stored contents are rendered again right away for a few pages, in
+        background otherwise.
+        """
+        self.invalidate_recordset(["content_parsed"])
+        if not self or not self._is_rendered_content_stored():
+            return
+        if len(self) <= self._RENDER_SYNC_LIMIT:
+            self._update_rendered_content()
+            return
+        self.sudo().write({"content_rendered_outdated": True})
+        self.env.ref("document_page_reference.ir_cron_render_content")._trigger()
+
+    @api.model
+    def _get_reference_codes(self, content):
+        """Return the references used by a template, without rendering it."""
+        try:
+            ast = mako_template_env.parse(tools.ustr(content or ""))
+        except TemplateSyntaxError:
+            return set()
+        names = meta.find_undeclared_variables(ast)
+        names -= set(mako_template_env.globals) | set(self._get_template_variables())
+        # references given to ref() as literals
+        for call in ast.find_all(nodes.Call):
+            if (
+                isinstance(call.node, nodes.Name)
+                and call.node.name == "ref"
+                and call.args
+                and isinstance(call.args[0], nodes.Const)
+                and isinstance(call.args[0].value, str)
+            ):
+                names.add(call.args[0].value)
+        return names
+
+    def init(self):
+        super().init()
+        # prefix searches of the completion, the trigram index serves the rest
+        tools.create_index(
+            self.env.cr,
+            "document_page_reference_prefix_index",
+            self._table,
+            ["reference text_pattern_ops"],
+        )
+
+    @api.model
+    def complete_reference(self, term, limit=10):
+        """Return the pages whose reference or name matches ``term``.
+
+        References starting with ``term`` come first, then the ones
+        containing it and the pages whose name contains it. Only pages
+        readable by the user are returned.
+        """
+        limit = min(int(limit or 10), 50)
+        term = (term or "").strip()
+        if not term:
+            return []
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pages = self.search(
+            [("reference", "=like", escaped + "%")], order="reference", limit=limit
+        )
+        if len(pages) < limit:
+            pages |= self.search(
+                [
+                    ("id", "not in", pages.ids),
+                    "|",
+                    ("reference", "ilike", escaped),
+                    ("name", "ilike", escaped),
+                ],
+                order="reference, name",
+                limit=limit - len(pages),
+            )
+        return [
+            {
+                "id": page.id,
+                "reference": page.reference,
+                "name": page.name,
+                "display_name": page.display_name,
+            }
+            for page in pages
+        ]
 
     @api.constrains("reference")
     def _check_reference(self):
-        for record in self:
-            if not record.reference:
-                continue
-            record._validate_reference(record=record)
+        references = [record.reference for record in self if record.reference]
+        if not references:
+            return
+        if not all(name_re.match(reference) for reference in references):
+            raise ValidationError(_("Reference is not valid"))
+        # pending values of these pages are compared to the stored ones of
+        # the others, flushed by create() and write() beforehand so that
+        # renames in the same transaction are reported here rather than by
+        # the unique index
+        if len(set(references)) < len(references) or self._get_taken_references(
+            references, exclude_ids=self.ids
+        ):
+            raise ValidationError(_("Reference must be unique"))
 
     @api.model
     def _validate_reference(self, record=None, reference=None):
@@ -91,16 +457,46 @@ class DocumentPage(models.Model):
         if self.search(uniq_domain):
             raise ValidationError(_("Reference must be unique"))
 
+    def _get_documents(self, codes):
+        """Return the documents of the given references as a dict.
+
+        Hook created in order to add check on other models, all the
+        references of a page are resolved at once. Codes without document
+        are left out. Extensions still overriding ``_get_document`` get
+        their codes resolved one by one through it.
+        """
+        if type(self)._get_document is not DocumentPage._get_document:
+            documents = {code: self._get_document(code) for code in codes}
+            return {code: document for code, document in documents.items() if document}
+        return self._fetch_documents(codes)
+
+    def _fetch_documents(self, codes):
+        documents = self.search([("reference", "in", list(codes))])
+        return {document.reference: document for document in documents}
+
     def _get_document(self, code):
-        # Hook created in order to add check on other models
-        document = self.search([("reference", "=", code)])
-        if document:
-            return document
-        else:
-            return self.env[self._name]
+        """Return the document of a reference.
+
+        Deprecated hook, override ``_get_documents`` instead.
+        """
+        return self._fetch_documents([code]).get(code, self.env[self._name])
 
     def get_reference(self, code):
-        element = self._get_document(code)
+        return self._render_reference(code, self._get_document(code))
+
+    def _get_references(self, codes):
+        """Return the rendered references of the given codes as a dict."""
+        # documents found by one search share their prefetching, so their
+        # display names are computed together
+        documents = self._get_documents(codes)
+        return {
+            code: self._render_reference(
+                code, documents.get(code, self.env[self._name])
+            )
+            for code in codes
+        }
+
+    def _render_reference(self, code, element):
         if self.env.context.get("raw_reference", False):
             return html_escape(element.display_name)
         text = """<a href="#" class="oe_direct_line"
@@ -119,31 +515,189 @@ class DocumentPage(models.Model):
     def _get_template_variables(self):
         return {"ref": self.get_reference}
 
+    def _get_template(self):
+        """Return the compiled template of the content and its variables.
+
+        The variables are the names the template uses without defining them,
+        the references to resolve. Templates are cached per page with the
+        digest of their source, a template is compiled again only once the
+        content has changed.
+        """
+        source = tools.ustr(self.content)
+        digest = compute_digest(source)
+        key = (self.env.cr.dbname, self.id)
+        if isinstance(self.id, int):
+            cached = template_cache.get(key)
+            if cached and cached[0] == digest:
+                return cached[1], cached[2]
+        ast = mako_template_env.parse(source)
+        names = meta.find_undeclared_variables(ast) - set(mako_template_env.globals)
+        template = mako_template_env.from_string(ast)
+        if isinstance(self.id, int):
+            # compiled templates take a few times the size of their source
+            template_cache.set(key, (digest, template, names), size=len(source) * 4)
+        return template, names
+
+    @api.model
+    def get_template_cache_stats(self):
+        """Return the usage statistics of the compiled templates cache."""
+        return template_cache.stats()
+
+    def _write(self, vals):
+        res = super()._write(vals)
+        if "history_head" in vals:
+            for page_id in self.ids:
+                template_cache.pop((self.env.cr.dbname, page_id))
+            if self._is_rendered_content_stored():
+                self.env.ref(
+                    "document_page_reference.ir_cron_render_content"
+                )._trigger()
+        return res
+
+    @api.model
+    def _get_render_limits(self):
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "timeout": float(
+                params.get_param("document_page_reference.render_timeout", 2)
+            ),
+            "operations": int(
+                params.get_param(
+                    "document_page_reference.render_max_operations", 100000
+                )
+            ),
+            "max_size": int(
+                params.get_param("document_page_reference.render_max_size", 1000000)
+            ),
+        }
+
+    def _render_template(self, template, variables):
+        """Render a template within the limits of time, operations and size."""
+        limits = self._get_render_limits()
+        render_budget.value = {
+            "operations": limits["operations"],
+            "deadline": time.monotonic() + limits["timeout"],
+            "max_size": limits["max_size"],
+        }
+        try:
+            chunks = []
+            size = 0
+            for chunk in template.generate(variables):
+                size += len(chunk)
+                if size > limits["max_size"]:
+                    raise RenderLimitError(_("The rendered content is too large."))
+                spend_render_budget()
+                chunks.append(chunk)
+            return "".join(chunks)
+        finally:
+            render_budget.value = None
+
     def get_content(self):
+        # a revision that failed to render is not rendered again
+        head = (
+            self.history_head if self.type == "content" else self.history_head.browse()
+        )
+        if head.render_error:
+            return self.content
         try:
-            content = self.content
-            mako_env = mako_template_env
-            template = mako_env.from_string(tools.ustr(content))
-            return template.render(self._get_template_variables())
-        except Exception:
+            template, names = self._get_template()
+            variables = self._get_template_variables()
+            codes = [name for name in names if name not in variables]
+            if codes:
+                variables.update(self._get_references(codes))
+            return self._render_template(template, variables)
+        except RenderTimeoutError:
+            # the time taken depends on the load, it may render next time
+            _logger.warning("Template from page with id = %s timed out", self.id)
+            return self.content
+        except (TemplateSyntaxError, RenderLimitError) as e:
             _logger.error(
                 "Template from page with id = %s cannot be processed" % self.id
             )
+            if isinstance(head.id, int):
+                head.sudo().render_error = str(e) or e.__class__.__name__
+            return self.content
+        except Exception:
+            _logger.exception(
+                "Template from page with id = %s cannot be processed" % self.id
+            )
             return self.content
 
     def get_raw_content(self):
         return self.with_context(raw_reference=True).get_content()
 
+    @api.model
+    def _get_taken_references(self, references, exclude_ids=None, variants=False):
+        """Return the given references already used, with their numbered
+        variants when ``variants`` is set.
+
+        A single query covers all the references, archived pages and pages
+        of other companies included.
+        """
+        query = "SELECT reference FROM document_page WHERE (reference = ANY(%s)"
+        params = [list(references)]
+        if variants:
+            query += " OR substring(reference from '^(.*)_[0-9]+$') = ANY(%s)"
+            params.append(list(references))
+        query += ") AND NOT id = ANY(%s)"
+        params.append(list(exclude_ids or []))
+        self.env.cr.execute(query, params)
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _propose_references(self, vals_list):
+        """Propose a reference to the new pages without one.
+
+        The reference is the slug of the name. Slugs already used by
+        existing pages are not proposed, pages of the same batch sharing one
+        get numbered suffixes in their order.
+        """
+        proposals = {}
+        for index, vals in enumerate(vals_list):
+            if vals.get("reference"):
+                continue
+            reference = slugify(vals.get("name") or "").replace("-", "_")
+            if name_re.match(reference):
+                proposals[index] = reference
+        if not proposals:
+            return
+        self.flush_model(["reference"])
+        stored = self._get_taken_references(set(proposals.values()), variants=True)
+        taken = stored | {
+            vals["reference"] for vals in vals_list if vals.get("reference")
+        }
+        for index, reference in proposals.items():
+            if reference in stored:
+                # Do not fill reference.
+                continue
+            candidate, number = reference, 2
+            while candidate in taken:
+                candidate = f"{reference}_{number}"
+                number += 1
+            taken.add(candidate)
+            vals_list[index]["reference"] = candidate
+
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            if not vals.get("reference"):
-                # Propose a default reference
-                reference = slugify(vals.get("name")).replace("-", "_")
-                try:
-                    self._validate_reference(reference=reference)
-                    vals["reference"] = reference
-                except ValidationError:  # pylint: disable=W8138
-                    # Do not fill reference.
-                    pass
-        return super().create(vals_list)
+        self.flush_model(["reference"])
+        self._propose_references(vals_list)
+        records = super().create(vals_list)
+        # references to these pages may have been dangling until now
+        records._get_referencing_pages()._invalidate_rendered_content()
+        return records
+
+    def write(self, vals):
+        if "name" not in vals and "reference" not in vals:
+            return super().write(vals)
+        if "reference" in vals:
+            self.flush_model(["reference"])
+        referencing = self._get_referencing_pages()
+        res = super().write(vals)
+        (referencing | self._get_referencing_pages())._invalidate_rendered_content()
+        return res
+
+    def unlink(self):
+        referencing = self._get_referencing_pages() - self
+        res = super().unlink()
+        referencing._invalidate_rendered_content()
+        return res
@@ -0,0 +1,54 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+
+class DocumentPageHistory(models.Model):
+    _inherit = "document.page.history"
+
+    reference_link_ids = fields.One2many(
+        "document.page.reference.link", "history_id", "References"
+    )
+    render_error = fields.Text(
+        help="Why the content could not be rendered, it is not rendered again "
+        "until it changes",
+        readonly=True,
+        copy=False,
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._update_reference_links()
+        return records
+
+    def write(self, vals):
+        if "content" in vals:
+            vals = dict(vals, render_error=False)
+        res = super().write(vals)
+        if "content" in vals:
+            self._update_reference_links()
+        return res
+
+    def _update_reference_links(self):
+        """Store the references used by the content of these revisions."""
+        links = self.env["document.page.reference.link"].sudo()
+        links.search([("history_id", "in", self.ids)]).unlink()
+        pages = self.env["document.page"]
+        links.create(
+            [
+                {"history_id": rec.id, "code": code}
+                for rec in self
+                for code in sorted(pages._get_reference_codes(rec.content))
+            ]
+        )
+
+    @api.model
+    def _backfill_reference_links(self, batch_size=1000):
+        """Store the references of the current revision of existing pages."""
+        pages = self.env["document.page"].sudo().with_context(active_test=False)
+        head_ids = pages.search([("history_head", "!=", False)]).history_head.ids
+        for batch_ids in split_every(batch_size, head_ids):
+            self.sudo().browse(batch_ids)._update_reference_links()
+            self.env.invalidate_all()
@@ -0,0 +1,26 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+
+
+class DocumentPageReferenceLink(models.Model):
+    """Reference used by the content of a revision."""
+
+    _name = "document.page.reference.link"
+    _description = "Document Page Reference Link"
+
+    history_id = fields.Many2one(
+        "document.page.history",
+        "Revision",
+        required=True,
+        index=True,
+        ondelete="cascade",
+    )
+    page_id = fields.Many2one(
+        "document.page",
+        "Page",
+        related="history_id.page_id",
+        store=True,
+        index=True,
+    )
+    code = fields.Char("Reference", required=True, index=True)
@@ -0,0 +1,14 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = "res.config.settings"
+
+    document_page_reference_store_rendered_content = fields.Boolean(
+        string="Store Rendered Pages",
+        help="Keep the rendered content of pages instead of rendering their "
+        "references on each read",
+        config_parameter="document_page_reference.store_rendered_content",
+    )
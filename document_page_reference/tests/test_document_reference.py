@@ -1,6 +1,8 @@
 # Copyright 2019 Creu Blanca
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from unittest.mock import patch
+
 from odoo.exceptions import ValidationError
 from odoo.tests.common import TransactionCase
 
@@ -22,6 +24,12 @@ class TestDocumentReference(TransactionCase):
         with self.assertRaises(ValidationError):
             self.page2.write({"reference": self.page1.reference})
 
+    def test_constrains_swap(self):
+        page3 = self.page_obj.create({"name": "Test Page 3", "reference": "r3"})
+        self.page2.reference = "r4"
+        with self.assertRaises(ValidationError):
+            page3.reference = "r4"
+
     def test_constrains_02(self):
         with self.assertRaises(ValidationError):
             self.page2.write({"reference": self.page2.reference + "-02"})
@@ -57,6 +65,182 @@ class TestDocumentReference(TransactionCase):
         )
         self.assertFalse(new_page_duplicated_name.reference)
 
+    def test_template_cache(self):
+        self.page1.get_content()
+        stats = self.page_obj.get_template_cache_stats()
+        self.page1.invalidate_recordset(["content_parsed"])
+        self.assertRegex(self.page1.content_parsed, ".*%s.*" % self.page2.display_name)
+        self.assertEqual(
+            self.page_obj.get_template_cache_stats()["hits"], stats["hits"] + 1
+        )
+        self.page1.content = "<p>${r1}</p>"
+        self.env.flush_all()
+        self.assertRegex(self.page1.content_parsed, ".*%s.*" % self.page1.display_name)
+        self.assertEqual(
+            self.page_obj.get_template_cache_stats()["misses"], stats["misses"] + 1
+        )
+
+    def test_batched_references(self):
+        page = self.page_obj.create(
+            {"name": "Glossary", "content": "<p>${R1} ${r2} ${r4}</p>"}
+        )
+        __, names = page._get_template()
+        self.assertEqual(names, {"R1", "r2", "r4"})
+        self.assertEqual(
+            page._get_documents(["R1", "r2", "r4"]),
+            {"R1": self.page1, "r2": self.page2},
+        )
+        content = page.get_content()
+        self.assertIn('data-oe-id="%s"' % self.page1.id, content)
+        self.assertIn('data-oe-id="%s"' % self.page2.id, content)
+        self.assertIn("<i>", content)
+
+    def test_get_document_override(self):
+        """Extensions overriding the single reference hook are still used."""
+        page_class = type(self.page_obj)
+        get_document = page_class._get_document
+
+        def _get_document(page, code):
+            return get_document(page, "r2" if code == "alias" else code)
+
+        page = self.page_obj.create({"name": "Alias Page", "content": "${alias}"})
+        with patch.object(page_class, "_get_document", _get_document):
+            self.assertIn(self.page2.display_name, page.get_content())
+
+    def test_backlinks(self):
+        self.assertFalse(self.page1.backlink_ids)
+        self.assertEqual(self.page2.backlink_ids, self.page1)
+        page = self.page_obj.create(
+            {"name": "Linking", "content": "<p>${R1} ${ref('r2')}</p>"}
+        )
+        self.assertEqual(
+            page.history_head.reference_link_ids.mapped("code"), ["R1", "r2"]
+        )
+        self.page1.invalidate_recordset(["backlink_ids"])
+        self.assertEqual(self.page1.backlink_ids, page)
+        self.assertEqual(self.page2._get_referencing_pages(), self.page1 | page)
+        # older revisions do not count
+        page.content = "<p>${r2}</p>"
+        self.page1.invalidate_recordset(["backlink_ids"])
+        self.assertFalse(self.page1.backlink_ids)
+        # renaming a page drops the rendered content of the referencing ones
+        self.assertIn(self.page2.name, self.page1.content_parsed)
+        self.page2.name = "Renamed Page"
+        self.assertIn("Renamed Page", self.page1.content_parsed)
+
+    def test_stored_rendered_content(self):
+        self.env["ir.config_parameter"].set_param(
+            "document_page_reference.store_rendered_content", True
+        )
+        self.assertIn(self.page1, self.page_obj._get_pages_to_render())
+        self.page_obj._cron_render_content(batch_size=1000)
+        self.assertFalse(self.page_obj._get_pages_to_render())
+        self.assertEqual(self.page1.content_rendered_head_id, self.page1.history_head)
+        self.assertIn(self.page2.display_name, self.page1.content_rendered)
+        # a new revision is rendered on read until the cron stores it
+        self.page1.content = "<p>${r2} again</p>"
+        self.assertIn("again", self.page1.content_parsed)
+        self.assertEqual(self.page_obj._get_pages_to_render(), self.page1)
+        # renaming a referenced page renders the referencing pages again
+        self.page_obj._cron_render_content()
+        self.page2.name = "Renamed Page"
+        self.assertIn("Renamed Page", self.page1.content_rendered)
+        self.assertIn("Renamed Page", self.page1.content_parsed)
+
+    def test_stored_rendered_content_access(self):
+        self.env["ir.config_parameter"].set_param(
+            "document_page_reference.store_rendered_content", True
+        )
+        self.page_obj._cron_render_content(batch_size=1000)
+        self.assertIn(self.page2.display_name, self.page1.content_rendered)
+        user = self.env["res.users"].create(
+            {
+                "name": "Restricted user",
+                "login": "restricted_reference_user",
+                "groups_id": [
+                    (6, 0, self.env.ref("document_knowledge.group_document_user").ids)
+                ],
+            }
+        )
+        self.env["ir.rule"].create(
+            {
+                "name": "Hide r2",
+                "model_id": self.env.ref("document_page.model_document_page").id,
+                "domain_force": "[('reference', '!=', 'r2')]",
+            }
+        )
+        content = self.page1.with_user(user).content_parsed
+        self.assertNotIn(self.page2.display_name, content)
+        self.assertIn(self.page2.display_name, self.page1.content_parsed)
+
+    def test_auto_reference_batch(self):
+        pages = self.page_obj.create(
+            [{"name": "Batch Page"}, {"name": "batch page"}, {"name": "Batch-Page"}]
+        )
+        self.assertEqual(
+            pages.mapped("reference"), ["batch_page", "batch_page_2", "batch_page_3"]
+        )
+        with self.assertRaises(ValidationError):
+            self.page_obj.create(
+                [
+                    {"name": "Other Page 1", "reference": "other"},
+                    {"name": "Other Page 2", "reference": "other"},
+                ]
+            )
+
+    def test_auto_reference_variant(self):
+        """A numbered reference does not prevent the plain one."""
+        self.page_obj.create({"name": "Section 1", "reference": "section_1"})
+        page = self.page_obj.create({"name": "Section"})
+        self.assertEqual(page.reference, "section")
+
+    def test_render_limits(self):
+        self.env["ir.config_parameter"].set_param(
+            "document_page_reference.render_max_operations", 1000
+        )
+        page = self.page_obj.create(
+            {
+                "name": "Runaway Page",
+                "content": "<p><% for i in range(100000) %>${i}<% endfor %></p>",
+            }
+        )
+        self.assertEqual(page.get_content(), page.content)
+        self.assertTrue(page.history_head.render_error)
+        page.content = "<p>${'x' * 10000000}</p>"
+        self.assertFalse(page.history_head.render_error)
+        self.assertEqual(page.get_content(), page.content)
+        self.assertTrue(page.history_head.render_error)
+        page.content = "<p>${'x'.ljust(10 ** 9)}${'x' | center(10 ** 9)}</p>"
+        self.assertEqual(page.get_content(), page.content)
+        self.assertTrue(page.history_head.render_error)
+        page.content = "<p>${range(5) | length} ${range(5)[2]}</p>"
+        self.assertEqual(page.get_content(), "<p>5 2</p>")
+        page.content = "<p>${r2}</p>"
+        self.assertIn(self.page2.display_name, page.get_content())
+        self.assertFalse(page.history_head.render_error)
+        # timeouts depend on the load, they are not kept on the revision
+        self.env["ir.config_parameter"].set_param(
+            "document_page_reference.render_timeout", -1
+        )
+        self.assertEqual(page.get_content(), page.content)
+        self.assertFalse(page.history_head.render_error)
+
+    def test_complete_reference(self):
+        page = self.page_obj.create(
+            {"name": "Glossary of R terms", "reference": "gloss"}
+        )
+        other = self.page_obj.create({"name": "Other", "reference": "other_r1"})
+        res = self.page_obj.complete_reference("r")
+        self.assertEqual(res[0]["id"], self.page2.id)
+        self.assertEqual(
+            {item["id"] for item in res} & {page.id, other.id}, {page.id, other.id}
+        )
+        self.assertEqual(self.page_obj.complete_reference("r", limit=1), res[:1])
+        # wildcards are matched literally
+        res = self.page_obj.complete_reference("r_")
+        self.assertEqual([item["id"] for item in res], [other.id])
+        self.assertFalse(self.page_obj.complete_reference(""))
+
     def test_get_formview_action(self):
         res = self.page1.get_formview_action()
         view_id = self.env.ref("document_page.view_wiki_form").id